@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Comprueba que delta_analyzer da el mismo delta en todos sus modos (por
+# archivo, --jobs, --batch; con y sin --cache-dir) sobre un repo de prueba con
+# los casos delicados: cambio de tipo (symlink -> archivo), cambio sólo de
+# modo, lockfile, submódulo, rename y paths con espacios/no ASCII.
+#
+#   python qualityrisk/bench/delta_modes_check.py
+#
+# Sale con 1 y muestra el primer archivo distinto si algún modo no coincide.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+import delta_analyzer  # noqa: E402
+
+MODES = [
+    ("per-file", []),
+    ("jobs", ["--jobs", "3"]),
+    ("batch", ["--batch"]),
+]
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.invalid",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.invalid",
+}
+
+
+def git(*args: str) -> str:
+    env = {**os.environ, **GIT_ENV}
+    return subprocess.run(["git", *args], check=True, capture_output=True, text=True, env=env).stdout.strip()
+
+
+def write(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def make_repo(root: str) -> tuple[str, str]:
+    # Devuelve (base, head); deja el cwd en `root`
+    os.chdir(root)
+    git("init", "-q")
+    write("target.txt", "a\n")
+    os.symlink("target.txt", "link")
+    write("mode.sh", "echo hi\n")
+    write("package-lock.json", '{\n"a": 1\n}\n')
+    write("js/app.js", "one\n")
+    write("js/old name.js", "".join(f"line {i}\n" for i in range(20)))
+    write("docs/ñandú.md", "x\n")
+    git("add", "-A")
+    git("update-index", "--add", "--cacheinfo", f"160000,{'1' * 40},sub")
+    git("commit", "-qm", "base")
+    base = git("rev-parse", "HEAD")
+
+    os.remove("link")
+    write("link", "now a file\n")
+    os.chmod("mode.sh", 0o755)
+    write("package-lock.json", '{\n"a": 2\n}\n')
+    write("js/app.js", "one\ntwo\nthree\n")
+    git("mv", "js/old name.js", "js/new name.js")
+    write("js/new name.js", "".join(f"line {i}\n" for i in range(20)) + "tail\n")
+    write("docs/ñandú.md", "y\n")
+    git("add", "-A")
+    git("update-index", "--add", "--cacheinfo", f"160000,{'2' * 40},sub")
+    git("commit", "-qm", "head")
+    return base, git("rev-parse", "HEAD")
+
+
+def run_mode(base: str, head: str, extra: list[str]) -> dict:
+    args = delta_analyzer.build_parser().parse_args(
+        ["--base", base, "--head", head, "--out", os.devnull, "--ignore-file", "", *extra]
+    )
+    delta = delta_analyzer.build_delta(args)
+    return {"stats": delta["stats"], "files": delta["files"], "cache": delta["meta"].get("cache")}
+
+
+def first_difference(ref: dict, got: dict, renames: bool = True) -> str | None:
+    # renames=False: por archivo, el destino de un rename es un archivo nuevo
+    # (ver delta_analyzer.cache_key), así que sólo se comparan las demás entradas
+    if renames and ref["stats"] != got["stats"]:
+        return f"stats: {json.dumps(ref['stats'])} != {json.dumps(got['stats'])}"
+    if len(ref["files"]) != len(got["files"]):
+        return f"files: {len(ref['files'])} != {len(got['files'])}"
+    for a, b in zip(ref["files"], got["files"]):
+        if not renames and "previous_path" in a:
+            continue
+        if a != b:
+            return f"{a['path']}: {json.dumps(a, ensure_ascii=False)} != {json.dumps(b, ensure_ascii=False)}"
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--keep", action="store_true", help="Keep the scratch repo and print its path")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="qr-delta-check-")
+    cache_dir = os.path.join(tmp, "cache")
+    repo = os.path.join(tmp, "repo")
+    os.makedirs(repo)
+    cwd = os.getcwd()
+    try:
+        base, head = make_repo(repo)
+        statuses = sorted({line.split("\t")[0].split(" ")[-1][0] for line in git("diff", "--raw", f"{base}..{head}").splitlines()})
+        print(f"scratch repo: statuses {''.join(statuses)}")
+
+        refs = {name: run_mode(base, head, extra) for name, extra in MODES}
+        failed = False
+        diff = first_difference(refs["per-file"], refs["batch"], renames=False)
+        print(f"  {'batch/per-file':<16} {'ok' if diff is None else 'MISMATCH'}")
+        if diff is not None:
+            print(f"    {diff}")
+            failed = True
+
+        # Cada modo contra su referencia sin cache, con una cache compartida
+        # (fría en la primera pasada; --batch y por archivo no comparten claves)
+        runs = [(name, extra) for name, extra in MODES]
+        runs += list(reversed(MODES)) + list(MODES)
+        for i, (name, extra) in enumerate(runs):
+            got = run_mode(base, head, extra if i < len(MODES) else [*extra, "--cache-dir", cache_dir])
+            ref = refs[name if name != "jobs" else "per-file"]
+            diff = first_difference(ref, got)
+            cache = got["cache"]
+            label = name if cache is None else f"{name}+cache"
+            note = f" (cache hits {cache['hits']}, misses {cache['misses']})" if cache else ""
+            print(f"  {label:<16} {'ok' if diff is None else 'MISMATCH'}{note}")
+            if diff is not None:
+                print(f"    {diff}")
+                failed = True
+        ref = refs["batch"]
+        print(f"churn_lines {ref['stats']['churn_lines']}, files {ref['stats']['files_changed']}")
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"kept {tmp}")
+        else:
+            subprocess.run(["rm", "-rf", tmp], check=False)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# Stand-in local de SonarCloud + GitHub API para medir sonar_fetch.py y
+# pr_comment.py sin red. Reproduce fixtures grabados e inyecta latencia,
+# paginación, 429 y análisis pendiente.
+#
+#   python qualityrisk/bench/standin_server.py --fixture qualityrisk/bench/fixtures/pr_small.json \
+#       --port 8765 --latency-ms 40 --pending-polls 3 --rate-limit-every 7
+#
+#   SONAR_TOKEN=x python qualityrisk/scripts/sonar_fetch.py --sonar-host http://127.0.0.1:8765 ...
+#   GITHUB_TOKEN=x python qualityrisk/scripts/pr_comment.py --api-url http://127.0.0.1:8765 ...
+#
+# GET /__stats devuelve los contadores por ruta (peticiones, 429 servidos).
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SONAR_MAX_PAGE_SIZE = 500
+
+COMMENTS_RE = re.compile(r"^/repos/([^/]+/[^/]+)/issues/(\d+)/comments$")
+COMMENT_RE = re.compile(r"^/repos/([^/]+/[^/]+)/issues/comments/(\d+)$")
+
+
+def load_fixture(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def synthetic_issues(project_key: str, count: int, files: int) -> list[dict]:
+    sevs = ["BLOCKER", "CRITICAL", "MAJOR", "MAJOR", "MINOR", "MINOR", "INFO"]
+    rnd = random.Random(count * 31 + files)
+    out = []
+    for i in range(count):
+        line = rnd.randint(1, 400)
+        out.append({
+            "key": f"SYN-{i}",
+            "rule": f"javascript:S{1000 + i % 50}",
+            "severity": sevs[i % len(sevs)],
+            "component": f"{project_key}:src/file_{i % files}.js",
+            "line": line,
+            "textRange": {"startLine": line, "endLine": line + i % 3},
+            "message": f"Synthetic issue {i}",
+            "flows": [{"locations": [{"msg": "x" * 40}]}] if i % 4 == 0 else [],
+            "impacts": [{"softwareQuality": "MAINTAINABILITY", "severity": "MEDIUM"}],
+        })
+    return out
+
+
+class StandIn:
+    def __init__(self, fixture: dict, args):
+        self.args = args
+        sonar = fixture.get("sonar") or {}
+        self.project_key = sonar.get("project_key", "bench-project")
+        self.quality_gate = sonar.get("quality_gate") or {"projectStatus": {"status": "OK"}}
+        self.task_id = sonar.get("ce_task_id", "AX-bench")
+        self.issues = list(sonar.get("issues") or [])
+        if args.synthetic_issues:
+            self.issues += synthetic_issues(self.project_key, args.synthetic_issues, args.synthetic_files)
+        self.pending_polls = args.pending_polls if args.pending_polls is not None else int(sonar.get("pending_polls", 0))
+        self.comments = [dict(c) for c in ((fixture.get("github") or {}).get("comments") or [])]
+        self.next_comment_id = max([int(c.get("id", 0)) for c in self.comments] + [1000]) + 1
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.polls = 0
+        self.stats = {}
+
+    def count(self, route: str, key: str = "requests"):
+        with self.lock:
+            st = self.stats.setdefault(route, {"requests": 0, "throttled": 0})
+            st[key] += 1
+
+    def throttle(self) -> bool:
+        every = self.args.rate_limit_every
+        with self.lock:
+            self.requests += 1
+            return bool(every) and self.requests % every == 0
+
+    def analysis_ready(self) -> bool:
+        with self.lock:
+            self.polls += 1
+            return self.polls > self.pending_polls
+
+    # ---- Sonar
+    def project_status(self, q: dict):
+        if not self.analysis_ready():
+            return 200, {"projectStatus": {"status": "NONE"}}
+        return 200, self.quality_gate
+
+    def ce_task(self, q: dict):
+        task_id = (q.get("id") or [""])[0]
+        if task_id != self.task_id:
+            return 404, {"errors": [{"msg": f"No activity found for task '{task_id}'"}]}
+        status = "SUCCESS" if self.analysis_ready() else "IN_PROGRESS"
+        return 200, {"task": {"id": task_id, "type": "REPORT", "status": status}}
+
+    def issues_search(self, q: dict):
+        keys = set((q.get("componentKeys") or [self.project_key])[0].split(","))
+        page = int((q.get("p") or ["1"])[0])
+        size = min(int((q.get("ps") or ["100"])[0]), SONAR_MAX_PAGE_SIZE)
+        if self.project_key in keys:
+            sel = self.issues
+        else:
+            sel = [i for i in self.issues if i.get("component") in keys]
+        chunk = sel[(page - 1) * size:page * size]
+        return 200, {
+            "paging": {"pageIndex": page, "pageSize": size, "total": len(sel)},
+            "issues": chunk,
+        }
+
+    # ---- GitHub
+    def list_comments(self, q: dict):
+        page = int((q.get("page") or ["1"])[0])
+        per_page = min(int((q.get("per_page") or ["30"])[0]), 100)
+        with self.lock:
+            return 200, self.comments[(page - 1) * per_page:page * per_page]
+
+    def create_comment(self, body: dict):
+        with self.lock:
+            c = {"id": self.next_comment_id, "body": body.get("body", "")}
+            self.next_comment_id += 1
+            self.comments.append(c)
+        return 201, c
+
+    def update_comment(self, comment_id: int, body: dict):
+        with self.lock:
+            for c in self.comments:
+                if int(c.get("id", 0)) == comment_id:
+                    c["body"] = body.get("body", "")
+                    return 200, c
+        return 404, {"message": "Not Found"}
+
+
+def make_handler(state: StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *a):
+            if state.args.verbose:
+                super().log_message(fmt, *a)
+
+        def reply(self, code: int, payload, headers: dict | None = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self) -> dict:
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"{}") if n else {}
+
+        def dispatch(self, method: str):
+            u = urlparse(self.path)
+            q = parse_qs(u.query)
+            if u.path == "/__stats":
+                return self.reply(200, {"routes": state.stats, "comments": len(state.comments)})
+
+            body = self.read_body() if method in ("POST", "PATCH") else {}
+            route, handler = self.route(method, u.path, q, body)
+            if handler is None:
+                return self.reply(404, {"message": "Not Found"})
+
+            lat = state.args.latency_ms + random.uniform(0, state.args.jitter_ms)
+            if lat:
+                time.sleep(lat / 1000.0)
+            if state.throttle():
+                state.count(route, "throttled")
+                return self.reply(429, {"message": "rate limited"}, {"Retry-After": str(state.args.retry_after)})
+            state.count(route)
+            code, payload = handler()
+            self.reply(code, payload)
+
+        def route(self, method: str, path: str, q: dict, body: dict):
+            if method == "GET" and path == "/api/qualitygates/project_status":
+                return "sonar.project_status", lambda: state.project_status(q)
+            if method == "GET" and path == "/api/ce/task":
+                return "sonar.ce_task", lambda: state.ce_task(q)
+            if method == "GET" and path == "/api/issues/search":
+                return "sonar.issues_search", lambda: state.issues_search(q)
+            m = COMMENTS_RE.match(path)
+            if m and method == "GET":
+                return "github.list_comments", lambda: state.list_comments(q)
+            if m and method == "POST":
+                return "github.create_comment", lambda: state.create_comment(body)
+            m = COMMENT_RE.match(path)
+            if m and method == "PATCH":
+                return "github.update_comment", lambda: state.update_comment(int(m.group(2)), body)
+            return None, None
+
+        def do_GET(self):
+            self.dispatch("GET")
+
+        def do_POST(self):
+            self.dispatch("POST")
+
+        def do_PATCH(self):
+            self.dispatch("PATCH")
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fixture", required=True)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429")
+    ap.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429")
+    ap.add_argument("--pending-polls", type=int, default=None, help="Analysis polls answered as pending before ready")
+    ap.add_argument("--synthetic-issues", type=int, default=0, help="Extra generated issues (paging benchmarks)")
+    ap.add_argument("--synthetic-files", type=int, default=50)
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    state = StandIn(load_fixture(args.fixture), args)
+    srv = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Stand-in listening on http://{args.host}:{srv.server_port} (issues={len(state.issues)})", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,44 @@
 import argparse
-import json
 from datetime import datetime, timezone
 
+import tracing
+
 def load(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return tracing.load_json(path)
+
+def build_evidence(
+    repo: str,
+    pr,
+    base: str,
+    head: str,
+    delta: dict,
+    tests: dict,
+    sonar: dict,
+    risk: dict | None = None,
+    policy_result: dict | None = None,
+) -> dict:
+    payload = {
+        "meta": {
+            "repo": repo,
+            "pull_request": int(pr),
+            "base_sha": base,
+            "head_sha": head,
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "format_version": "0.2.0",
+            # Spans hasta este punto (subprocesos, HTTP, JSON, reglas); ver tracing.py
+            "timings": tracing.timings(),
+        },
+        "delta": delta,
+        "tests": tests,
+        "sonar": sonar,
+    }
+
+    if risk is not None:
+        payload["risk"] = risk
+
+    if policy_result is not None:
+        payload["policy"] = policy_result
+    return payload
 
 def main():
     ap = argparse.ArgumentParser()
@@ -20,28 +54,19 @@ def main():
     ap.add_argument("--policy-result", required=False)
     args = ap.parse_args()
 
-    payload = {
-        "meta": {
-            "repo": args.repo,
-            "pull_request": int(args.pr),
-            "base_sha": args.base,
-            "head_sha": args.head,
-            "generated_at": datetime.now(timezone.utc).isoformat(),
-            "format_version": "0.2.0",
-        },
-        "delta": load(args.delta),
-        "tests": load(args.tests),
-        "sonar": load(args.sonar),
-    }
-
-    if args.risk:
-        payload["risk"] = load(args.risk)
-
-    if args.policy_result:
-        payload["policy"] = load(args.policy_result)    
+    payload = build_evidence(
+        args.repo,
+        args.pr,
+        args.base,
+        args.head,
+        load(args.delta),
+        load(args.tests),
+        load(args.sonar),
+        load(args.risk) if args.risk else None,
+        load(args.policy_result) if args.policy_result else None,
+    )
 
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2, ensure_ascii=False)
+    tracing.dump_json(payload, args.out, indent=2, ensure_ascii=False)
 
 if __name__ == "__main__":
     main()
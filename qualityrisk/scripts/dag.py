@@ -0,0 +1,110 @@
+# Planificador asyncio para etapas con dependencias (DAG). Cada etapa corre en
+# un hilo (asyncio.to_thread) en cuanto terminan sus dependencias, así las
+# esperas de red (Sonar, GitHub) y los subprocesos (tests, git) se solapan.
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+
+class Stop(Exception):
+    # Corta la rama: las etapas que dependen de esta no se ejecutan
+    pass
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable
+    deps: tuple = ()  # sus resultados se pasan a fn, en orden
+    after: tuple = ()  # solo orden, sin pasar resultado
+    status: str = "pending"  # ok | stopped | skipped | failed
+    result: Any = None
+    error: Optional[BaseException] = None
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def waits_on(self) -> tuple:
+        return self.deps + self.after
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end - self.start) if self.end is not None else 0.0
+
+
+async def run_stage(st: Stage, stages: dict, tasks: dict, t0: float):
+    if st.waits_on:
+        await asyncio.gather(*(tasks[d] for d in st.waits_on))
+    if any(stages[d].status != "ok" for d in st.waits_on):
+        st.status = "skipped"
+        return
+    st.start = time.perf_counter() - t0
+    try:
+        st.result = await asyncio.to_thread(st.fn, *(stages[d].result for d in st.deps))
+        st.status = "ok"
+    except Stop:
+        st.status = "stopped"
+    except Exception as e:
+        st.status = "failed"
+        st.error = e
+    st.end = time.perf_counter() - t0
+
+
+async def run_all(stages: dict):
+    t0 = time.perf_counter()
+    tasks = {}
+    for st in stages.values():
+        tasks[st.name] = asyncio.create_task(run_stage(st, stages, tasks, t0))
+    await asyncio.gather(*tasks.values())
+
+
+def run_dag(stage_list: list[Stage]) -> dict[str, Stage]:
+    # Las dependencias deben declararse antes que la etapa (orden topológico => sin ciclos)
+    stages: dict[str, Stage] = {}
+    for st in stage_list:
+        if st.name in stages:
+            raise ValueError(f"Duplicate stage: {st.name}")
+        missing = [d for d in st.waits_on if d not in stages]
+        if missing:
+            raise ValueError(f"Stage {st.name} depends on undeclared stage(s): {', '.join(missing)}")
+        stages[st.name] = st
+
+    asyncio.run(run_all(stages))
+
+    failed = [st for st in stage_list if st.status == "failed"]
+    if failed:
+        raise failed[0].error
+    return stages
+
+
+def critical_path(stages: dict[str, Stage]) -> list[Stage]:
+    # Desde la última etapa en terminar, hacia atrás por la dependencia que terminó más tarde
+    ran = [st for st in stages.values() if st.end is not None]
+    if not ran:
+        return []
+    st = max(ran, key=lambda s: s.end)
+    path = [st]
+    while st.waits_on:
+        st = max((stages[d] for d in st.waits_on), key=lambda s: s.end)
+        path.append(st)
+    return path[::-1]
+
+
+def report_lines(stages: dict[str, Stage]) -> list[str]:
+    lines = []
+    for st in sorted(stages.values(), key=lambda s: (s.start is None, s.start or 0.0)):
+        if st.start is None:
+            lines.append(f"  {st.name:<16} {st.status}")
+        else:
+            lines.append(f"  {st.name:<16} {st.status:<8} {st.start:7.2f}s -> {st.end:7.2f}s  ({st.elapsed:.2f}s)")
+
+    path = critical_path(stages)
+    if path:
+        busy = sum(s.elapsed for s in stages.values())
+        lines.append(
+            "  critical path: "
+            + " -> ".join(f"{s.name} ({s.elapsed:.2f}s)" for s in path)
+            + f" = {path[-1].end:.2f}s wall, {busy:.2f}s of stage time"
+        )
+    return lines
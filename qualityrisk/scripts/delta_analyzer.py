@@ -1,142 +1,621 @@
 #!/usr/bin/env python3
 import argparse
-import json
+import hashlib
 import os
 import re
+import shutil
 import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+import disk_cache
+import tracing
+from jsonstream import JsonObjectWriter, render_item
+
 HUNK_RE = re.compile(r"^@@\s+-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@")
 
+NULL_SHA = "0" * 40
+CACHE_VERSION = "v3"
+CACHE_VERSION_RE = re.compile(r"^v\d+$")
+PATHSPEC_CHUNK = 500
+
+# Archivos que no se revisan línea a línea: sin hunks y fuera de churn_lines
+CLASSIFY_GLOBS = {
+    "lockfile": [
+        "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml",
+        "poetry.lock", "Pipfile.lock", "uv.lock", "Cargo.lock", "composer.lock",
+        "Gemfile.lock", "go.sum",
+    ],
+    "minified": ["*.min.js", "*.min.mjs", "*.min.css"],
+    "generated": [
+        "*.map", "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*",
+        "**/__generated__/**", "**/dist/**",
+    ],
+}
+
 def sh(cmd: list[str]) -> str:
-    return subprocess.check_output(cmd, text=True)
+    with tracing.cmd_span(cmd):
+        return subprocess.check_output(cmd, text=True)
+
+def sh_lines(cmd: list[str]):
+    # Lee stdout línea a línea: el diff completo nunca vive en memoria.
+    # El span cubre la vida del stream (incluye lo que tarda el consumidor)
+    with tracing.cmd_span(cmd) as span:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, text=True, encoding="utf-8", errors="replace", bufsize=1 << 16
+        )
+        try:
+            for line in proc.stdout:
+                yield line.rstrip("\n")
+        finally:
+            proc.stdout.close()
+            rc = proc.wait()
+            span["exit_code"] = rc
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
 
-def head_file_set() -> set[str]:
-    out = sh(["git", "ls-tree", "-r", "--name-only", "HEAD"])
-    return set(l.strip() for l in out.splitlines() if l.strip())
+def head_missing_paths(paths: list[str]) -> set[str]:
+    # Sólo consulta los paths cambiados (`git cat-file --batch-check`, un proceso)
+    # en vez de cargar todo `git ls-tree -r HEAD` en memoria.
+    if not paths:
+        return set()
+    queries = [f"HEAD:{p}" for p in paths]
+    cmd = ["git", "cat-file", "--batch-check"]
+    with tracing.cmd_span(cmd, paths=len(paths)):
+        out = subprocess.run(
+            cmd, input="".join(q + "\n" for q in queries), capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+    missing = set()
+    for p, q, line in zip(paths, queries, out):
+        # "<q> missing": no existe; "<sha> tree <n>": directorio (ls-tree -r no lo listaba);
+        # "<sha> missing" es un submódulo (gitlink) y sí existe.
+        if line == f"{q} missing" or line.split(" ")[1:2] == ["tree"]:
+            missing.add(p)
+    return missing
+
+C_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13, '"': 34, "\\": 92}
+
+def unquote_path(p: str) -> str:
+    # git (core.quotePath) entrecomilla los paths no ASCII o con caracteres
+    # especiales al estilo C: "\303\261ame.txt" -> ñame.txt
+    if len(p) < 2 or p[0] != '"' or p[-1] != '"':
+        return p
+    s = p[1:-1]
+    out = bytearray()
+    i = 0
+    while i < len(s):
+        c = s[i]
+        if c == "\\" and s[i + 1:i + 2] in C_ESCAPES:
+            out.append(C_ESCAPES[s[i + 1]])
+            i += 2
+        elif c == "\\" and len(s[i + 1:i + 4]) == 3 and all(ch in "01234567" for ch in s[i + 1:i + 4]):
+            out.append(int(s[i + 1:i + 4], 8))
+            i += 4
+        else:
+            out += c.encode("utf-8")
+            i += 1
+    return out.decode("utf-8", errors="replace")
 
 def parse_name_status(line: str):
     # M\tpath
     # A\tpath
     # D\tpath
     # R100\told\tnew
+    # (los paths pueden venir entrecomillados; un tab real llega como \t)
     parts = line.split("\t")
+    parts = parts[:1] + [unquote_path(p) for p in parts[1:]]
     st = parts[0]
     if st.startswith(("R", "C")) and len(parts) >= 3:
         return st, parts[1], parts[2]  # old, new
     return st, None, parts[1]
 
-def should_ignore(path: str, ignore_paths: set[str], ignore_prefixes: list[str]) -> bool:
-    if path in ignore_paths:
-        return True
-    return any(path.startswith(p) for p in ignore_prefixes)
+GLOB_META = set("*?[")
 
-def file_numstat(base: str, head: str, path: str) -> tuple[int, int]:
-    out = sh(["git", "diff", "--numstat", f"{base}..{head}", "--", path]).strip()
-    if not out:
-        return 0, 0
-    a, d, _ = out.split("\t", 2)
+def glob_to_regex(pattern: str) -> str:
+    # Sintaxis estilo .gitignore: `*`/`?` no cruzan "/", `**` sí.
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[" and "]" in pattern[i + 1:]:
+            j = pattern.index("]", i + 1)
+            body = pattern[i + 1:j]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = j + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+def split_rules(globs) -> list[tuple[bool, list[str]]]:
+    # Agrupa patrones consecutivos del mismo signo: [(negado, [patrones])].
+    # `!pat` vuelve a incluir; `\!pat` es un `!` literal (se resuelve en add_glob).
+    blocks = []
+    for g in globs:
+        g = g.strip()
+        if not g or g.startswith("#"):
+            continue
+        negated = g.startswith("!")
+        if negated:
+            g = g[1:]
+            if not g:
+                continue
+            if g.startswith(("!", "#")):
+                g = "\\" + g  # el matcher del bloque lo vuelve a leer: que sea literal
+        if blocks and blocks[-1][0] == negated:
+            blocks[-1][1].append(g)
+        else:
+            blocks.append((negated, [g]))
+    return blocks
+
+class IgnoreMatcher:
+    # Se compila una vez: paths exactos en un set, prefijos literales en un
+    # trie por caracteres y todos los globs en una sola regex. Con `!pat`, como
+    # en .gitignore, gana la última regla que casa: cada bloque posterior de
+    # reglas del mismo signo es un matcher propio que se consulta primero.
+    # (A diferencia de git, `!` también re-incluye dentro de un directorio
+    # excluido.)
+    END = ""
+
+    def __init__(self, paths=(), prefixes=(), globs=()):
+        self.paths = set()
+        self.trie = {}
+        regexes = []
+        for p in paths:
+            self.paths.add(p)
+        for p in prefixes:
+            self.add_prefix(p)
+        blocks = split_rules(globs)
+        own = blocks.pop(0)[1] if blocks and not blocks[0][0] else []
+        for g in own:
+            r = self.add_glob(g)
+            if r:
+                regexes.append(r)
+        self.glob_rx = re.compile("|".join(f"(?:{r})" for r in regexes)) if regexes else None
+        self.overrides = [(negated, IgnoreMatcher(globs=gs)) for negated, gs in blocks]
+
+    def add_prefix(self, prefix: str):
+        node = self.trie
+        for c in prefix:
+            node = node.setdefault(c, {})
+        node[self.END] = True
+
+    def add_glob(self, pattern: str):
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith("#"):
+            return None
+        if pattern.startswith(("\\!", "\\#")):
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if anchored and not (GLOB_META & set(pattern)):
+            # Literal anclado a la raíz: va al trie / set, sin regex
+            self.add_prefix(pattern + "/")
+            if not dir_only:
+                self.paths.add(pattern)
+            return None
+        rx = glob_to_regex(pattern)
+        if not anchored:
+            rx = "(?:.*/)?" + rx
+        return rx + ("/.*" if dir_only else "(?:/.*)?")
+
+    def has_prefix(self, path: str) -> bool:
+        node = self.trie
+        for c in path:
+            if self.END in node:
+                return True
+            node = node.get(c)
+            if node is None:
+                return False
+        return self.END in node
+
+    def match(self, path: str) -> bool:
+        for negated, m in reversed(self.overrides):
+            if m.match(path):
+                return not negated
+        if path in self.paths or self.has_prefix(path):
+            return True
+        return bool(self.glob_rx and self.glob_rx.fullmatch(path))
+
+def load_ignore_file(path: str) -> list[str]:
+    if not path or not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [l.rstrip("\n") for l in f]
+
+def parse_numstat(line: str) -> tuple[int, int, bool]:
+    # git reporta los binarios como "-\t-\tpath"
+    a, d, _ = line.split("\t", 2)
     add = int(a) if a.isdigit() else 0
     dele = int(d) if d.isdigit() else 0
-    return add, dele
+    return add, dele, (a == "-" and d == "-")
+
+def file_numstat(base: str, head: str, path: str) -> tuple[int, int, bool]:
+    out = sh(["git", "diff", "--numstat", f"{base}..{head}", "--", path]).strip()
+    if not out:
+        return 0, 0, False
+    return parse_numstat(out)
+
+def parse_hunk_header(line: str):
+    m = HUNK_RE.match(line)
+    if not m:
+        return None
+    old_start = int(m.group(1))
+    old_len = int(m.group(2) or "1")
+    new_start = int(m.group(3))
+    new_len = int(m.group(4) or "1")
+
+    old_end = old_start + old_len - 1 if old_len > 0 else old_start - 1
+    new_end = new_start + new_len - 1 if new_len > 0 else new_start - 1
+
+    return {
+        "header": line,
+        "old_start": old_start, "old_len": old_len, "old_end": old_end,
+        "new_start": new_start, "new_len": new_len, "new_end": new_end,
+        "deletion_only": (new_len == 0),
+    }
 
 def file_hunks(base: str, head: str, path: str):
-    diff = sh(["git", "diff", "--no-color", "--unified=0", f"{base}..{head}", "--", path])
     hunks = []
-    for line in diff.splitlines():
+    for line in sh_lines(["git", "diff", "--no-color", "--unified=0", f"{base}..{head}", "--", path]):
         if not line.startswith("@@ "):
             continue
-        m = HUNK_RE.match(line)
-        if not m:
-            continue
-        old_start = int(m.group(1))
-        old_len = int(m.group(2) or "1")
-        new_start = int(m.group(3))
-        new_len = int(m.group(4) or "1")
-
-        old_end = old_start + old_len - 1 if old_len > 0 else old_start - 1
-        new_end = new_start + new_len - 1 if new_len > 0 else new_start - 1
-
-        hunks.append({
-            "header": line,
-            "old_start": old_start, "old_len": old_len, "old_end": old_end,
-            "new_start": new_start, "new_len": new_len, "new_end": new_end,
-            "deletion_only": (new_len == 0),
-        })
+        h = parse_hunk_header(line)
+        if h:
+            hunks.append(h)
     return hunks
 
-def main():
+def parse_raw(line: str) -> dict:
+    # :100644 100644 <old_blob> <new_blob> M\tpath
+    # :100644 100644 <old_blob> <new_blob> R097\told\tnew
+    meta, names = line[1:].split("\t", 1)
+    _, _, old_blob, new_blob, st = meta.split(" ")
+    st, old_path, path = parse_name_status(f"{st}\t{names}")
+    return {"status": st, "old_path": old_path, "path": path, "old_blob": old_blob, "new_blob": new_blob}
+
+def list_changes(base: str, head: str) -> list[dict]:
+    cmd = ["git", "diff", "--raw", "--no-abbrev", f"{base}..{head}"]
+    return [parse_raw(line) for line in sh_lines(cmd) if line.startswith(":")]
+
+def batch_diff(base: str, head: str, paths: list[str] | None = None):
+    # Un solo `git diff` para todo el rango: la sección --raw trae status/paths
+    # y cada "diff --git" posterior corresponde, en el mismo orden, a una entrada.
+    # Un cambio de tipo (T, p.ej. symlink -> archivo) sale como dos secciones
+    # con el mismo header (borrado + alta): se suman a la misma entrada.
+    # Cada entrada se emite en cuanto empieza la siguiente.
+    cmd = ["git", "--literal-pathspecs", "diff", "--no-color", "--raw", "--no-abbrev", "-p", "--unified=0", f"{base}..{head}"]
+    if paths:
+        cmd += ["--", *paths]
+    entries = []
+    idx = -1
+    cur = None
+    header = None
+    in_header = False
+    for line in sh_lines(cmd):
+        if line.startswith(":") and idx < 0:
+            e = parse_raw(line)
+            e.update({"additions": 0, "deletions": 0, "hunks": [], "binary": False})
+            entries.append(e)
+            continue
+        if line.startswith("diff --git "):
+            in_header = True
+            if line == header:
+                continue
+            header = line
+            if cur is not None:
+                yield cur
+            idx += 1
+            cur = entries[idx] if idx < len(entries) else None
+            if cur is not None:
+                entries[idx] = None
+            continue
+        if cur is None:
+            continue
+        if line.startswith("@@ "):
+            in_header = False
+            h = parse_hunk_header(line)
+            if h:
+                cur["hunks"].append(h)
+        elif in_header:
+            # index/mode/---/+++/Binary files ...
+            if line.startswith("Binary files "):
+                cur["binary"] = True
+            continue
+        elif line.startswith("+"):
+            cur["additions"] += 1
+        elif line.startswith("-"):
+            cur["deletions"] += 1
+    if cur is not None:
+        yield cur
+    for e in entries[idx + 1:]:
+        yield e
+
+def batch_diff_entries(base: str, head: str, entries: list[dict]):
+    # Diff de `entries` (en su orden) con un `git diff` por grupo de paths.
+    # Los renames incluyen el path anterior para que git vuelva a emparejarlos.
+    for i in range(0, len(entries), PATHSPEC_CHUNK):
+        chunk = entries[i:i + PATHSPEC_CHUNK]
+        paths = []
+        for e in chunk:
+            if e["old_path"]:
+                paths.append(e["old_path"])
+            paths.append(e["path"])
+        stream = batch_diff(base, head, paths)
+        pending = {}
+        for e in chunk:
+            while e["path"] not in pending:
+                got = next(stream, None)
+                if got is None:
+                    break
+                pending[got["path"]] = got
+            got = pending.pop(e["path"], None)
+            if got is None:
+                got = {"additions": 0, "deletions": 0, "hunks": [], "binary": False}
+            yield {k: got[k] for k in ("additions", "deletions", "hunks", "binary")}
+        for _ in stream:
+            pass
+
+def numstat_entries(base: str, head: str, entries: list[dict]):
+    # Sólo conteos (sin -p) para archivos clasificados; --raw y --numstat
+    # salen en el mismo orden, así que se emparejan por posición.
+    for i in range(0, len(entries), PATHSPEC_CHUNK):
+        chunk = entries[i:i + PATHSPEC_CHUNK]
+        paths = []
+        for e in chunk:
+            if e["old_path"]:
+                paths.append(e["old_path"])
+            paths.append(e["path"])
+        cmd = ["git", "--literal-pathspecs", "diff", "--raw", "--numstat", "--no-abbrev", f"{base}..{head}", "--", *paths]
+        raws = []
+        stats = {}
+        n = 0
+        for line in sh_lines(cmd):
+            if line.startswith(":"):
+                raws.append(parse_raw(line)["path"])
+            elif line and n < len(raws):
+                stats[raws[n]] = parse_numstat(line)
+                n += 1
+        for e in chunk:
+            add, dele, binary = stats.get(e["path"], (0, 0, False))
+            yield {"additions": add, "deletions": dele, "hunks": [], "binary": binary}
+
+def classify_path(path: str, classifiers: dict) -> str | None:
+    for kind, matcher in classifiers.items():
+        if matcher.match(path):
+            return kind
+    return None
+
+def per_file_diff(base: str, head: str, path: str) -> dict:
+    add, dele, binary = file_numstat(base, head, path)
+    hunks = [] if binary else file_hunks(base, head, path)
+    return {"additions": add, "deletions": dele, "hunks": hunks, "binary": binary}
+
+def per_file_entries(base: str, head: str, entries: list[dict], jobs: int = 1):
+    if jobs <= 1:
+        for e in entries:
+            yield per_file_diff(base, head, e["path"])
+        return
+    # Ventana acotada de futures: el orden de salida es el de `entries`
+    # y nunca hay más de jobs*4 resultados esperando en memoria.
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        window = deque()
+        for e in entries:
+            window.append(pool.submit(per_file_diff, base, head, e["path"]))
+            if len(window) >= jobs * 4:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+# -----------------------
+# Cache de hunks por par de blobs
+# -----------------------
+def cache_key(e: dict, batch: bool) -> str:
+    old_blob = e["old_blob"]
+    if not batch and e["status"][0] in ("R", "C"):
+        # `git diff -- path` ve el destino de un rename/copy como archivo nuevo
+        old_blob = NULL_SHA
+    # El path entra en la clave: .gitattributes puede cambiar el contexto de los
+    # headers. El modo también: un error de un modo no se sirve a los demás
+    mode = "batch" if batch else "file"
+    return hashlib.sha1(f"{mode}\0{e['status'][0]}\0{old_blob}\0{e['new_blob']}\0{e['path']}".encode("utf-8")).hexdigest()
+
+def cache_file(cache_dir: str, key: str) -> str:
+    return disk_cache.cache_file(os.path.join(cache_dir, CACHE_VERSION), key)
+
+def cache_get(cache_dir: str, key: str):
+    return disk_cache.cache_get(os.path.join(cache_dir, CACHE_VERSION), key)
+
+def cache_put(cache_dir: str, key: str, data: dict):
+    disk_cache.cache_put(os.path.join(cache_dir, CACHE_VERSION), key, data)
+
+def cache_evict(cache_dir: str, max_bytes: int) -> int:
+    # Las versiones anteriores de la cache (restaurada por actions/cache) se borran enteras
+    evicted = 0
+    for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        if CACHE_VERSION_RE.match(name) and name != CACHE_VERSION:
+            for _, _, names in os.walk(os.path.join(cache_dir, name)):
+                evicted += len(names)
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    return evicted + disk_cache.cache_evict(os.path.join(cache_dir, CACHE_VERSION), max_bytes)
+
+def resolve_diffs(args, entries: list[dict], cache_stats: dict):
+    # Devuelve additions/deletions/hunks de cada entrada, en orden. Con cache,
+    # sólo los pares de blobs no vistos antes pasan por git.
+    keys = [cache_key(e, args.batch) for e in entries] if args.cache_dir else [None] * len(entries)
+    hits = [k is not None and os.path.exists(cache_file(args.cache_dir, k)) for k in keys]
+    misses = [e for e, hit in zip(entries, hits) if not hit]
+    if args.batch:
+        computed = batch_diff_entries(args.base, args.head, misses)
+    else:
+        computed = per_file_entries(args.base, args.head, misses, args.jobs)
+
+    for e, key, hit in zip(entries, keys, hits):
+        data = cache_get(args.cache_dir, key) if hit else None
+        if data is not None:
+            cache_stats["hits"] += 1
+            yield data
+            continue
+        if hit:
+            # Entrada ilegible o desalojada entre tanto: se recalcula aparte
+            resolve = batch_diff_entries if args.batch else per_file_entries
+            data = next(resolve(args.base, args.head, [e]))
+        else:
+            data = next(computed)
+        if key is not None:
+            cache_stats["misses"] += 1
+            cache_put(args.cache_dir, key, data)
+        yield data
+
+def build_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser()
     ap.add_argument("--base", required=True)
     ap.add_argument("--head", required=True)
     ap.add_argument("--out", required=True)
     ap.add_argument("--ignore-path", action="append", default=[".gitignore"])
     ap.add_argument("--ignore-prefix", action="append", default=["node_modules/", "qualityrisk/out/"])
-    args = ap.parse_args()
+    ap.add_argument("--ignore-glob", action="append", default=[], help="gitignore-style pattern, e.g. '**/dist/**' or '*.min.js'")
+    ap.add_argument("--ignore-file", default=".qualityriskignore", help="gitignore-style patterns, one per line; '!pattern' re-includes (last match wins). Skipped if missing")
+    ap.add_argument("--no-classify", action="store_true", help="Extract hunks for lockfiles/minified/generated files too")
+    ap.add_argument("--batch", action="store_true", help="Single `git diff` for the whole range instead of per-file calls")
+    ap.add_argument("--jobs", type=int, default=1, help="Parallel git workers for per-file mode")
+    ap.add_argument("--cache-dir", default=None, help="Hunk cache keyed by blob pair (restorable as a CI cache)")
+    ap.add_argument("--cache-max-bytes", type=int, default=64 * 1024 * 1024)
+    return ap
 
-    head_files = head_file_set()
+def analyze(args, emit):
+    # emit(fobj) por archivo, en orden; devuelve (meta, stats, deleted) al final.
+    changes = list_changes(args.base, args.head)
 
-    name_status = sh(["git", "diff", "--name-status", f"{args.base}..{args.head}"]).splitlines()
-
-    out_files = []
     totals_add = 0
     totals_del = 0
 
-    deleted_files = []
+    # Ignora paths irrelevantes
+    ignore = IgnoreMatcher(
+        args.ignore_path,
+        args.ignore_prefix,
+        load_ignore_file(args.ignore_file) + args.ignore_glob,
+    )
+    changes = [e for e in changes if not ignore.match(e["path"])]
 
-    for raw in name_status:
-        if not raw.strip():
-            continue
+    missing = head_missing_paths([e["path"] for e in changes if e["status"][0] != "D"])
 
-        st, old_path, path = parse_name_status(raw)
-        st_norm = st[0]  # M/A/D/R/C...
+    entries = []
+    deleted_files = []
 
-        # Ignora paths irrelevantes
-        if should_ignore(path, set(args.ignore_path), args.ignore_prefix):
-            continue
+    for e in changes:
+        st, path = e["status"], e["path"]
+        st_norm = st[0]  # M/A/D/R/C...
 
         # Deleted: no existe en HEAD -> no rangos nuevos
-        if st_norm == "D" or path not in head_files:
+        if st_norm == "D" or path in missing:
             deleted_files.append({"path": path, "status": st})
             continue
 
-        add, dele = file_numstat(args.base, args.head, path)
-        hunks = file_hunks(args.base, args.head, path)
+        entries.append(e)
+
+    classifiers = {} if args.no_classify else {k: IgnoreMatcher(globs=g) for k, g in CLASSIFY_GLOBS.items()}
+    kinds = [classify_path(e["path"], classifiers) for e in entries]
 
-        totals_add += add
-        totals_del += dele
+    cache_stats = {"hits": 0, "misses": 0}
+    diffed = resolve_diffs(args, [e for e, k in zip(entries, kinds) if k is None], cache_stats)
+    counted = numstat_entries(args.base, args.head, [e for e, k in zip(entries, kinds) if k is not None])
 
-        out_files.append({
-            "path": path,
-            "status": st,
-            **({"previous_path": old_path} if old_path else {}),
+    classified = {}
+    files_count = 0
+    for e, kind in zip(entries, kinds):
+        d = next(diffed) if kind is None else next(counted)
+        if d.get("binary"):
+            kind = "binary"
+        add, dele = d["additions"], d["deletions"]
+        if kind is None:
+            totals_add += add
+            totals_del += dele
+        else:
+            # Lockfiles/binarios/minificados/generados: resumen compacto y churn aparte
+            c = classified.setdefault(kind, {"files": 0, "additions": 0, "deletions": 0})
+            c["files"] += 1
+            c["additions"] += add
+            c["deletions"] += dele
+
+        emit({
+            "path": e["path"],
+            "status": e["status"],
+            **({"previous_path": e["old_path"]} if e["old_path"] else {}),
             "additions": add,
             "deletions": dele,
-            "hunks": hunks,
+            "hunks": d["hunks"],
+            **({"class": kind} if kind else {}),
         })
+        files_count += 1
 
-    payload = {
-        "meta": {
-            "generated_at": datetime.now(timezone.utc).isoformat(),
-            "tool": "qualityrisk.delta_analyzer",
-            "version": "1.2.0",
-            "base": args.base,
-            "head": args.head,
-        },
-        "stats": {
-            "files_changed": len(out_files),
-            "additions": totals_add,
-            "deletions": totals_del,
-            "churn_lines": totals_add + totals_del,
-            "deleted_files": len(deleted_files),
-        },
-        "files": out_files,
-        "deleted": deleted_files,
+    meta = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "tool": "qualityrisk.delta_analyzer",
+        "version": "1.3.0",
+        "base": args.base,
+        "head": args.head,
+    }
+    if args.cache_dir:
+        cache_stats["evicted"] = cache_evict(args.cache_dir, args.cache_max_bytes)
+        meta["cache"] = cache_stats
+    stats = {
+        "files_changed": files_count,
+        "additions": totals_add,
+        "deletions": totals_del,
+        "churn_lines": totals_add + totals_del,
+        "deleted_files": len(deleted_files),
+        "classified": classified,
+        "classified_churn_lines": sum(c["additions"] + c["deletions"] for c in classified.values()),
     }
+    return meta, stats, deleted_files
+
+def build_delta(args) -> dict:
+    # Versión en memoria (orquestador): mismo contenido que delta.json
+    files = []
+    meta, stats, deleted_files = analyze(args, files.append)
+    return {"meta": meta, "stats": stats, "files": files, "deleted": deleted_files}
+
+def main():
+    args = build_parser().parse_args()
 
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2, ensure_ascii=False)
+    spool = tempfile.TemporaryFile("w+", encoding="utf-8", dir=os.path.dirname(args.out) or None)
+    files_count = 0
+
+    def emit(fobj: dict):
+        nonlocal files_count
+        spool.write(render_item(fobj, files_count == 0))
+        files_count += 1
+
+    meta, stats, deleted_files = analyze(args, emit)
+
+    # Mismos bytes que json.dump(payload, indent=2); `files` sale del spool
+    with tracing.span("json.dump", "json", path=args.out), spool, open(args.out, "w", encoding="utf-8") as f:
+        w = JsonObjectWriter(f)
+        w.value("meta", meta)
+        w.value("stats", stats)
+        w.spooled_list("files", spool, files_count)
+        w.value("deleted", deleted_files)
+        w.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Cache en disco direccionada por contenido: un JSON por clave en
+# <dir>/<key[:2]>/<key>.json, escritura atómica y expulsión LRU por mtime.
+import json
+import os
+
+import tracing
+
+
+def cache_file(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], f"{key}.json")
+
+
+def cache_get(cache_dir: str, key: str):
+    p = cache_file(cache_dir, key)
+    try:
+        with tracing.span("cache.get", "json", path=p), open(p, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    os.utime(p)  # LRU: la mtime marca el último uso
+    return data
+
+
+def cache_put(cache_dir: str, key: str, data):
+    p = cache_file(cache_dir, key)
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+    tmp = f"{p}.{os.getpid()}.tmp"
+    with tracing.span("cache.put", "json", path=p), open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, p)
+
+
+def cache_evict(cache_dir: str, max_bytes: int) -> int:
+    items = []
+    total = 0
+    for root, _, names in os.walk(cache_dir):
+        for n in names:
+            p = os.path.join(root, n)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            items.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+    evicted = 0
+    for _, size, p in sorted(items):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(p)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
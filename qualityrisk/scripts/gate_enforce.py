@@ -1,24 +1,27 @@
 #!/usr/bin/env python3
 import argparse
-import json
 import sys
 
+import tracing
+
 def load_json(p: str):
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return tracing.load_json(p)
+
+def gate_decision(policy_result: dict) -> tuple[str, str, bool]:
+    mode = str(policy_result.get("mode") or "advisory").lower()
+    decision = str(policy_result.get("decision") or "PASS").upper()
+    return mode, decision, mode == "enforcing" and decision == "BLOCK"
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--policy-result", required=True)
     args = ap.parse_args()
 
-    pr = load_json(args.policy_result)
-    mode = str(pr.get("mode") or "advisory").lower()
-    decision = str(pr.get("decision") or "PASS").upper()
+    mode, decision, blocked = gate_decision(load_json(args.policy_result))
 
     print(f"Policy mode={mode} decision={decision}")
 
-    if mode == "enforcing" and decision == "BLOCK":
+    if blocked:
         print("QualityRisk gate: BLOCK (enforcing) -> failing job.")
         sys.exit(1)
 
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+import argparse
+import ast
+import hashlib
+import os
+import posixpath
+import re
+import sys
+from collections import deque
+from datetime import datetime, timezone
+
+import tracing
+from delta_analyzer import IgnoreMatcher
+from disk_cache import cache_evict, cache_get, cache_put
+from repo_files import TEST_FILE_RE, list_files, tracked_blobs, tree_sha
+
+INDEX_VERSION = 2
+LATEST_KEY = "latest"
+INDEX_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+JS_ROOTS = ["js", "backend"]
+JS_EXTS = (".js", ".mjs", ".cjs", ".jsx", ".ts", ".tsx")
+RESOLVE_EXTS = JS_EXTS + (".json",)
+CODE_EXTS = JS_EXTS + (".py",)
+
+# import x from "y" / import "y" / export ... from "y" / import("y") / require("y")
+JS_IMPORT_RE = re.compile(
+    r"""(?:\bimport\s+(?:[\w*{}\s,$]+?\s+from\s+)?|\bexport\s+[\w*{}\s,$]+?\s+from\s+|\b(?:require|import)\s*\(\s*)"""
+    r"""(["'])([^"'\n]+)\1"""
+)
+
+# Cambios que invalidan cualquier selección (dependencias, config de runners)
+RUN_ALL_GLOBS = [
+    "package.json",
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "jest.config.*",
+    "vitest.config.*",
+    "babel.config.*",
+    ".babelrc",
+    "tsconfig*.json",
+    "conftest.py",
+    "pytest.ini",
+    "pyproject.toml",
+    "setup.cfg",
+    "tox.ini",
+    "requirements*.txt",
+]
+
+def is_indexed(path: str, js_roots: list[str]) -> bool:
+    if TEST_FILE_RE.match(path) or path.endswith(".py"):
+        return True
+    return path.endswith(JS_EXTS) and any(path.startswith(r.rstrip("/") + "/") for r in js_roots)
+
+def resolve_js(src: str, spec: str, files: set[str]):
+    spec = spec.split("?", 1)[0].split("#", 1)[0]
+    if spec.startswith("."):
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(src), spec))
+    elif spec.startswith("/"):
+        base = spec.lstrip("/")
+    else:
+        return None  # paquete npm / builtin: fuera del repo
+    for cand in (base, *(base + e for e in RESOLVE_EXTS), *(f"{base}/index{e}" for e in RESOLVE_EXTS)):
+        if cand in files:
+            return cand
+    return base
+
+def js_deps(src: str, text: str, files: set[str]):
+    deps, unresolved = set(), []
+    for m in JS_IMPORT_RE.finditer(text):
+        spec = m.group(2)
+        target = resolve_js(src, spec, files)
+        if target is None:
+            continue
+        if target in files:
+            deps.add(target)
+        else:
+            unresolved.append(spec)
+    return deps, unresolved
+
+def resolve_py(module: str, roots: list[str], files: set[str]):
+    rel = module.replace(".", "/")
+    for root in roots:
+        base = f"{root}/{rel}" if root else rel
+        for cand in (base + ".py", base + "/__init__.py"):
+            if cand in files:
+                return cand
+    return None
+
+def py_deps(src: str, text: str, files: set[str]):
+    # Scripts hermanos (`from issue_table import ...`) resuelven desde su
+    # propio directorio; paquetes, desde la raíz del repo.
+    here = posixpath.dirname(src)
+    roots = [here, ""] if here else [""]
+    tree = ast.parse(text, filename=src)
+    deps = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            mods = [a.name for a in node.names]
+            search = roots
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                pkg = here
+                for _ in range(node.level - 1):
+                    pkg = posixpath.dirname(pkg)
+                search = [pkg]
+                base = node.module or ""
+            else:
+                search = roots
+                base = node.module
+            mods = ([base] if base else []) + [f"{base}.{a.name}" if base else a.name for a in node.names]
+        else:
+            continue
+        for mod in mods:
+            target = resolve_py(mod, search, files)
+            if target is not None and target != src:
+                deps.add(target)
+    return deps
+
+def build_index(root: str, js_roots: list[str], blobs: dict | None = None, prev: dict | None = None) -> dict:
+    files = list_files(root)
+    fileset = set(files)
+    listing = hashlib.sha256("\0".join(files).encode("utf-8")).hexdigest()
+    # Con los mismos paths que el índice previo las resoluciones de imports no
+    # cambian: sólo se vuelven a parsear los ficheros cuyo blob cambió
+    if not (blobs and prev and prev.get("listing") == listing and prev.get("js_roots") == js_roots):
+        prev = None
+    prev_errors = set(prev["parse_errors"]) if prev else set()
+    deps, unresolved, parse_errors = {}, {}, []
+    reused = 0
+    for path in files:
+        if not is_indexed(path, js_roots):
+            continue
+        if prev and path in prev["deps"] and blobs.get(path) is not None and prev["blobs"].get(path) == blobs.get(path):
+            deps[path] = prev["deps"][path]
+            if path in prev["unresolved"]:
+                unresolved[path] = prev["unresolved"][path]
+            if path in prev_errors:
+                parse_errors.append(path)
+            reused += 1
+            continue
+        try:
+            with open(os.path.join(root, path), "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            continue
+        if path.endswith(".py"):
+            try:
+                found = py_deps(path, text, fileset)
+            except SyntaxError:
+                parse_errors.append(path)
+                found = set()
+        elif path.endswith(JS_EXTS):
+            found, missing = js_deps(path, text, fileset)
+            if missing:
+                unresolved[path] = missing
+        else:
+            found = set()
+        deps[path] = sorted(found)
+    return {
+        "version": INDEX_VERSION,
+        "js_roots": js_roots,
+        "deps": deps,
+        "tests": sorted(p for p in deps if TEST_FILE_RE.match(p)),
+        "unresolved": unresolved,
+        "parse_errors": parse_errors,
+        "listing": listing,
+        "blobs": {p: blobs[p] for p in deps if p in blobs} if blobs else {},
+        "reused": reused,
+    }
+
+def load_index(root: str, js_roots: list[str], cache_dir: str | None, max_bytes: int = INDEX_CACHE_MAX_BYTES):
+    # Índice por SHA de árbol: sólo depende del contenido versionado. Un árbol
+    # nuevo parte del último índice construido (LATEST_KEY apunta a su árbol)
+    tree = tree_sha(root, worktree=True) if cache_dir else None
+    index_dir = os.path.join(cache_dir, "test-impact") if tree else None
+    prev, blobs = None, None
+    if index_dir:
+        index = cache_get(index_dir, tree)
+        if index and index.get("version") == INDEX_VERSION and index.get("js_roots") == js_roots:
+            return index, tree, True
+        latest = cache_get(index_dir, LATEST_KEY)
+        prev = cache_get(index_dir, latest["tree"]) if latest and latest.get("tree") else None
+        if prev and prev.get("version") != INDEX_VERSION:
+            prev = None
+        blobs = tracked_blobs(root)
+    index = build_index(root, js_roots, blobs, prev)
+    if index_dir:
+        # Una entrada por árbol: se podan las menos usadas al pasar del límite
+        cache_put(index_dir, tree, index)
+        cache_put(index_dir, LATEST_KEY, {"tree": tree})
+        cache_evict(index_dir, max_bytes)
+    return index, tree, False
+
+def changed_paths(delta: dict) -> tuple[list[str], list[str], list[str]]:
+    changed = [f["path"] for f in delta.get("files", []) or []]
+    previous = [f["previous_path"] for f in delta.get("files", []) or [] if f.get("previous_path")]
+    deleted = [d["path"] for d in delta.get("deleted", []) or []]
+    return changed, previous, deleted
+
+def select_tests(index: dict, changed: list[str], previous: list[str], deleted: list[str], run_all_globs: list[str]) -> dict:
+    deps = index["deps"]
+    tests = set(index["tests"])
+    run_all_match = IgnoreMatcher(globs=run_all_globs)
+
+    reasons = []
+    for path in changed + previous + deleted:
+        if run_all_match.match(path):
+            reasons.append({"path": path, "reason": "config_or_dependencies"})
+        elif path.endswith(CODE_EXTS) and path in deleted and not TEST_FILE_RE.match(path):
+            reasons.append({"path": path, "reason": "deleted_source"})
+        elif path.endswith(CODE_EXTS) and path in changed and path not in deps:
+            reasons.append({"path": path, "reason": "unindexed_source"})
+
+    # Grafo inverso: quién importa a quién; BFS desde cada fichero cambiado
+    rdeps = {}
+    for src, targets in deps.items():
+        for t in targets:
+            rdeps.setdefault(t, []).append(src)
+
+    impacted_by = {}
+    for path in changed:
+        seen = {path}
+        queue = deque([path])
+        while queue:
+            cur = queue.popleft()
+            if cur in tests:
+                impacted_by.setdefault(cur, []).append(path)
+            for parent in rdeps.get(cur, ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    queue.append(parent)
+
+    run_all = bool(reasons)
+    selected = sorted(tests) if run_all else sorted(impacted_by)
+    return {
+        "run_all": run_all,
+        "run_all_reasons": reasons,
+        "tests": selected,
+        "impacted_by": {t: sorted(set(v)) for t, v in sorted(impacted_by.items())},
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--delta", required=True)
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--root", default=".")
+    ap.add_argument("--js-root", action="append", default=None, help="Directories whose JS imports are indexed (repeatable)")
+    ap.add_argument("--run-all-glob", action="append", default=[], help="Extra glob that forces the full suite (repeatable)")
+    ap.add_argument("--cache-dir", default=None, help="Cache directory (dependency index per tree SHA)")
+    ap.add_argument("--cache-max-bytes", type=int, default=INDEX_CACHE_MAX_BYTES, help="Size limit of the index cache (LRU eviction)")
+    ap.add_argument("--list", action="store_true", help="Print the selected test files, one per line")
+    return ap
+
+def impact(args, delta: dict) -> dict:
+    js_roots = args.js_root or JS_ROOTS
+    index, tree, cached = load_index(args.root, js_roots, args.cache_dir, args.cache_max_bytes)
+    changed, previous, deleted = changed_paths(delta)
+    selection = select_tests(index, changed, previous, deleted, RUN_ALL_GLOBS + args.run_all_glob)
+
+    return {
+        "meta": {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "tool": "qualityrisk.impact_select",
+            "version": "1.0.0",
+            "tree": tree,
+            "index": {
+                "cached": cached,
+                "reused": index.get("reused", 0),
+                "files": len(index["deps"]),
+                "edges": sum(len(v) for v in index["deps"].values()),
+                "tests": len(index["tests"]),
+                "unresolved_imports": sum(len(v) for v in index["unresolved"].values()),
+                "parse_errors": index["parse_errors"],
+            },
+        },
+        "changed": changed,
+        "previous_paths": previous,
+        "deleted": deleted,
+        **selection,
+        "tests_total": len(index["tests"]),
+    }
+
+def main():
+    args = build_parser().parse_args()
+
+    delta = tracing.load_json(args.delta)
+
+    payload = impact(args, delta)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    tracing.dump_json(payload, args.out, indent=2, ensure_ascii=False)
+
+    if args.list:
+        for t in payload["tests"]:
+            sys.stdout.write(t + "\n")
+
+if __name__ == "__main__":
+    main()
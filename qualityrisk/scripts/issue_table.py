@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# sonar.json guarda cada issue una sola vez en `issues`; los matches del delta
+# son referencias {"ref": <índice>, "_delta_match": {...}} a esa tabla.
+
+# Campos pesados que no usa ningún consumidor (se conservan con --issue-field)
+DEFAULT_DROP_FIELDS = frozenset({
+    "flows",
+    "impacts",
+    "comments",
+    "transitions",
+    "actions",
+    "attr",
+    "codeVariants",
+    "messageFormattings",
+})
+
+
+def project_issue(issue: dict, drop: frozenset = DEFAULT_DROP_FIELDS) -> dict:
+    if not drop:
+        return issue
+    return {k: v for k, v in issue.items() if k not in drop}
+
+
+def delta_ref(index: int, match: dict) -> dict:
+    return {"ref": index, "_delta_match": match}
+
+
+def delta_issues(sonar: dict) -> list[dict]:
+    # Issues del delta con la forma de siempre (issue + _delta_match), sea cual
+    # sea el formato del sonar.json. Sin filtro por delta: todos los issues.
+    issues = sonar.get("issues", []) or []
+    filtered = sonar.get("issues_filtered_by_delta")
+    if filtered is None:
+        return issues
+    out = []
+    for it in filtered:
+        if "ref" in it:
+            out.append({**issues[it["ref"]], "_delta_match": it.get("_delta_match")})
+        else:
+            out.append(it)
+    return out
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import json
+import shutil
+
+
+def dumps_nested(obj, level: int) -> str:
+    # Igual que json.dump(indent=2) para un valor anidado `level` niveles.
+    return json.dumps(obj, indent=2, ensure_ascii=False).replace("\n", "\n" + "  " * level)
+
+
+def render_item(obj, first: bool) -> str:
+    # Elemento de una lista que cuelga de una clave top-level (nivel 2)
+    return ("" if first else ",") + "\n    " + dumps_nested(obj, 2)
+
+
+class JsonObjectWriter:
+    # Escribe un objeto top-level clave por clave con los mismos bytes que
+    # json.dump(obj, f, indent=2, ensure_ascii=False), sin tenerlo entero en memoria.
+    def __init__(self, f):
+        self.f = f
+        self.keys = 0
+        self.items = None
+
+    def _key(self, key: str):
+        self.f.write(("{" if self.keys == 0 else ",") + f"\n  {json.dumps(key, ensure_ascii=False)}: ")
+        self.keys += 1
+
+    def value(self, key: str, obj):
+        self._key(key)
+        self.f.write(dumps_nested(obj, 1))
+
+    def begin_list(self, key: str):
+        self._key(key)
+        self.items = 0
+
+    def item(self, obj):
+        first = self.items == 0
+        self.f.write(("[" if first else "") + render_item(obj, first))
+        self.items += 1
+
+    def end_list(self) -> int:
+        count = self.items
+        self.f.write("\n  ]" if count else "[]")
+        self.items = None
+        return count
+
+    def spooled_list(self, key: str, spool, count: int):
+        # `spool` contiene `count` elementos ya serializados con render_item()
+        self._key(key)
+        if not count:
+            self.f.write("[]")
+            return
+        self.f.write("[")
+        spool.seek(0)
+        shutil.copyfileobj(spool, self.f)
+        self.f.write("\n  ]")
+
+    def close(self):
+        self.f.write("\n}" if self.keys else "{}")
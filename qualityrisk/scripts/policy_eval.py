@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 import argparse
-import json
 from datetime import datetime, timezone
 from pathlib import Path
 
+import tracing
+from issue_table import delta_issues
+
 try:
     import yaml  # PyYAML
 except Exception:
@@ -13,8 +15,7 @@ ORDER = {"PASS": 0, "WARN": 1, "BLOCK": 2}
 
 
 def load_json(p: str):
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return tracing.load_json(p)
 
 
 def load_yaml(p: str):
@@ -69,10 +70,7 @@ def get_signal(evidence: dict, risk: dict, key: str):
 
 
 def count_delta_issues_by_sev(evidence: dict, severities: list[str]) -> int:
-    s = evidence.get("sonar") or {}
-    issues = s.get("issues_filtered_by_delta")
-    if issues is None:
-        issues = s.get("issues", []) or []
+    issues = delta_issues(evidence.get("sonar") or {})
     sevset = {x.upper() for x in severities}
     return sum(1 for it in issues if (it.get("severity") or "").upper() in sevset)
 
@@ -208,18 +206,7 @@ def eval_rule(evidence: dict, risk: dict, rule: dict):
     }
 
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--evidence", required=True)
-    ap.add_argument("--risk", required=True)
-    ap.add_argument("--policy", required=True)
-    ap.add_argument("--out", required=True)
-    args = ap.parse_args()
-
-    evidence = load_json(args.evidence)
-    risk = load_json(args.risk)
-
-    policy = load_yaml(args.policy)
+def evaluate(evidence: dict, risk: dict, policy: dict) -> dict:
     rules = policy.get("rules", [])
 
     evaluations = []
@@ -227,7 +214,9 @@ def main():
     violations = []
 
     for r in rules:
-        ev = eval_rule(evidence, risk, r)
+        with tracing.span(str(r.get("id")), "rule", type=r.get("type")) as span:
+            ev = eval_rule(evidence, risk, r)
+            span["status"] = ev["status"]
         evaluations.append(ev)
         decision = decision_max(decision, ev["status"])
         if ev["status"] in ("WARN", "BLOCK"):
@@ -235,7 +224,7 @@ def main():
                 {"rule_id": ev["rule_id"], "status": ev["status"], "reason": ev["reason"]}
             )
 
-    out = {
+    return {
         "meta": {
             "generated_at": datetime.now(timezone.utc).isoformat(),
             "tool": "qualityrisk.policy_eval",
@@ -248,9 +237,19 @@ def main():
         "evaluations": evaluations,
     }
 
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--evidence", required=True)
+    ap.add_argument("--risk", required=True)
+    ap.add_argument("--policy", required=True)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    out = evaluate(load_json(args.evidence), load_json(args.risk), load_yaml(args.policy))
+
     Path(args.out).parent.mkdir(parents=True, exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, indent=2, ensure_ascii=False)
+    tracing.dump_json(out, args.out, indent=2, ensure_ascii=False)
 
 
 if __name__ == "__main__":
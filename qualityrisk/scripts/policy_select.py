@@ -1,19 +1,27 @@
 #!/usr/bin/env python3
 import argparse
-import json
 from pathlib import Path
 
+import tracing
+
 TOOLING_ALLOWLIST = {
     ".github/workflows/qualityrisk.yml",
 }
 
 def load_json(p: str):
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return tracing.load_json(p)
 
 def is_tooling_path(p: str) -> bool:
     return p.startswith("qualityrisk/") or p in TOOLING_ALLOWLIST
 
+def select_policy(delta: dict, web_policy: str, tooling_policy: str) -> str:
+    files = [f.get("path","") for f in (delta.get("files") or [])]
+    files = [p for p in files if p]
+
+    if files and all(is_tooling_path(p) for p in files):
+        return tooling_policy
+    return web_policy
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--delta", required=True)
@@ -22,14 +30,7 @@ def main():
     ap.add_argument("--out", required=True)
     args = ap.parse_args()
 
-    delta = load_json(args.delta)
-    files = [f.get("path","") for f in (delta.get("files") or [])]
-    files = [p for p in files if p]
-
-    if files and all(is_tooling_path(p) for p in files):
-        selected = args.tooling_policy
-    else:
-        selected = args.web_policy
+    selected = select_policy(load_json(args.delta), args.web_policy, args.tooling_policy)
 
     Path(args.out).parent.mkdir(parents=True, exist_ok=True)
     Path(args.out).write_text(selected + "\n", encoding="utf-8")
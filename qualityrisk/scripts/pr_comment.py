@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import argparse
-import json
 import os
 import sys
 from dataclasses import dataclass
@@ -9,15 +8,17 @@ from typing import Any, Optional
 
 import requests
 
-API = "https://api.github.com"
+import issue_table
+import tracing
+
+API = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
 DEFAULT_MARKER = "<!-- qualityrisk-report -->"
 
 SEV_ORDER = {"BLOCKER": 0, "CRITICAL": 1, "MAJOR": 2, "MINOR": 3, "INFO": 4, "UNKNOWN": 9}
 
 
 def load_json(path: str) -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return tracing.load_json(path)
 
 
 def extract_path(component: str) -> str:
@@ -42,11 +43,7 @@ def severity_counts(issues: list[dict]) -> dict[str, int]:
 
 
 def pick_delta_issues(evidence: dict) -> list[dict]:
-    sonar = evidence.get("sonar") or {}
-    delta_issues = sonar.get("issues_filtered_by_delta")
-    if delta_issues is None:
-        delta_issues = sonar.get("issues", []) or []
-    return delta_issues or []
+    return issue_table.delta_issues(evidence.get("sonar") or {}) or []
 
 
 def issue_loc(issue: dict) -> str:
@@ -237,7 +234,9 @@ def find_existing_comment(repo: str, pr: int, token: str, marker: str) -> Option
 
     page = 1
     while True:
-        r = requests.get(url, headers=headers, params={"per_page": 100, "page": page}, timeout=15)
+        with tracing.span("GET issue comments", "http", page=page) as span:
+            r = requests.get(url, headers=headers, params={"per_page": 100, "page": page}, timeout=15)
+            span["status"] = r.status_code
         if r.status_code == 403:
             return None
         r.raise_for_status()
@@ -251,25 +250,44 @@ def find_existing_comment(repo: str, pr: int, token: str, marker: str) -> Option
         page += 1
 
 
-def upsert_comment(repo: str, pr: int, token: str, body: str, marker: str) -> None:
+def upsert_comment(repo: str, pr: int, token: str, body: str, marker: str, find=find_existing_comment) -> None:
     headers = gh_headers(token)
-    existing_id = find_existing_comment(repo, pr, token, marker)
+    existing_id = find(repo, pr, token, marker)
 
     if existing_id:
         url = f"{API}/repos/{repo}/issues/comments/{existing_id}"
-        r = requests.patch(url, headers=headers, json={"body": body}, timeout=15)
+        with tracing.span("PATCH issue comment", "http") as span:
+            r = requests.patch(url, headers=headers, json={"body": body}, timeout=15)
+            span["status"] = r.status_code
         r.raise_for_status()
         print(f"Updated QualityRisk PR comment (id={existing_id})")
         return
 
     url = f"{API}/repos/{repo}/issues/{pr}/comments"
-    r = requests.post(url, headers=headers, json={"body": body}, timeout=15)
+    with tracing.span("POST issue comment", "http") as span:
+        r = requests.post(url, headers=headers, json={"body": body}, timeout=15)
+        span["status"] = r.status_code
     r.raise_for_status()
     print("Created QualityRisk PR comment")
 
 
+def post_comment(repo: str, pr: int, md: str, marker: str, find=find_existing_comment) -> None:
+    token = os.environ.get("GITHUB_TOKEN")
+    if not token:
+        print("GITHUB_TOKEN not set; skipping PR comment.", file=sys.stderr)
+        return
+
+    try:
+        upsert_comment(repo, pr, token, md, marker, find)
+    except requests.HTTPError as e:
+        # Best-effort: don't break pipeline if comment fails
+        print(f"Failed to post PR comment: {e}", file=sys.stderr)
+
+
 def main():
+    global API
     ap = argparse.ArgumentParser()
+    ap.add_argument("--api-url", default=API, help="GitHub API base URL (env GITHUB_API_URL)")
     ap.add_argument("--repo", required=True, help="owner/repo")
     ap.add_argument("--pr", required=True, type=int)
     ap.add_argument("--evidence", required=True)
@@ -278,6 +296,8 @@ def main():
     ap.add_argument("--dry-run", action="store_true", help="Render only, do not post comment")
     args = ap.parse_args()
 
+    API = args.api_url.rstrip("/")
+
     evidence = load_json(args.evidence)
     md = build_markdown(evidence, args.marker)
 
@@ -290,16 +310,7 @@ def main():
     if args.dry_run:
         return
 
-    token = os.environ.get("GITHUB_TOKEN")
-    if not token:
-        print("GITHUB_TOKEN not set; skipping PR comment.", file=sys.stderr)
-        return
-
-    try:
-        upsert_comment(args.repo, args.pr, token, md, args.marker)
-    except requests.HTTPError as e:
-        # Best-effort: don't break pipeline if comment fails
-        print(f"Failed to post PR comment: {e}", file=sys.stderr)
+    post_comment(args.repo, args.pr, md, args.marker)
 
 
 if __name__ == "__main__":
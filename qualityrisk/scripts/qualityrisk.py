@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# `qualityrisk run`: todas las etapas del workflow en un solo proceso. Cada
+# etapa recibe los objetos de la anterior (sin releer JSON de disco) y los
+# artefactos se escriben al final en --out-dir con los mismos nombres y el
+# mismo contenido que generan los scripts por separado.
+#
+#   python qualityrisk/scripts/qualityrisk.py run --repo o/r --pr 12 --base <sha> --head <sha> \
+#       --tests-cmd "npm test" --tests-args="--timeout 900" --delta-args=--batch \
+#       --sonar-project-key KEY --sonar-args="--scope touched" --comment
+#
+# Las opciones propias de cada etapa van tal cual en --<etapa>-args (con `=`,
+# porque empiezan por guiones).
+#
+# Con --async las etapas independientes (tests, delta, espera del análisis de
+# Sonar, búsqueda del comentario del PR) corren a la vez (ver dag.py) y al
+# final se imprime la línea de tiempo y el camino crítico.
+import argparse
+import json
+import os
+import shlex
+import sys
+from functools import partial
+
+import requests
+
+import build_evidence_pack
+import dag
+import delta_analyzer
+import gate_enforce
+import impact_select
+import policy_eval
+import policy_select
+import pr_comment
+import risk_score
+import run_cmd_capture
+import sonar_fetch
+import tracing
+
+# Etapa -> artefacto en --out-dir
+ARTIFACTS = {
+    "tests": "test_report.json",
+    "delta": "delta.json",
+    "impact": "test_impact.json",
+    "policy_select": "selected_policy.txt",
+    "sonar": "sonar.json",
+    "risk": "risk_score.json",
+    "policy": "policy_result.json",
+    "evidence": "evidence_pack.json",
+    "report": "qualityrisk_report.md",
+}
+
+
+class Pipeline:
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+        self.written = set()
+
+    def path(self, stage: str) -> str:
+        return os.path.join(self.args.out_dir, ARTIFACTS[stage])
+
+    def emit(self, stage: str, obj):
+        self.results[stage] = obj
+        if self.args.write_each:
+            self.write(stage)
+
+    def write(self, stage: str):
+        obj = self.results[stage]
+        os.makedirs(self.args.out_dir, exist_ok=True)
+        with tracing.span("write", "json", path=self.path(stage)), open(self.path(stage), "w", encoding="utf-8") as f:
+            if stage == "policy_select":
+                f.write(obj + "\n")
+            elif stage == "report":
+                f.write(obj)
+            else:
+                json.dump(obj, f, indent=2, ensure_ascii=False)
+        self.written.add(stage)
+
+    def write_all(self):
+        if self.args.no_write or self.args.write_each:
+            return
+        for stage in ARTIFACTS:
+            if stage in self.results:
+                self.write(stage)
+
+    # ---- etapas
+    def tests(self) -> dict:
+        a = self.args
+        if a.tests_manifest and not os.path.exists(a.tests_manifest):
+            return run_cmd_capture.skipped_report(a.tests_name, f"No {a.tests_manifest} found, tests skipped")
+        if not a.tests_cmd:
+            return run_cmd_capture.skipped_report(a.tests_name, "No test command, tests skipped")
+        targs = run_cmd_capture.parse_args(
+            ["--name", a.tests_name, "--out", self.path("tests"), *shlex.split(a.tests_args), "--", *shlex.split(a.tests_cmd)]
+        )
+        return run_cmd_capture.capture(targs)
+
+    def delta(self) -> dict:
+        a = self.args
+        dargs = delta_analyzer.build_parser().parse_args(
+            ["--base", a.base, "--head", a.head, "--out", self.path("delta"), *shlex.split(a.delta_args)]
+        )
+        return delta_analyzer.build_delta(dargs)
+
+    def impact(self, delta: dict) -> dict:
+        iargs = impact_select.build_parser().parse_args(
+            ["--delta", self.path("delta"), "--out", self.path("impact"), *shlex.split(self.args.impact_args)]
+        )
+        return impact_select.impact(iargs, delta)
+
+    def sonar_args(self):
+        # None: sin project key o sin token (PRs de fork) -> stub
+        a = self.args
+        if not a.sonar_project_key or not os.environ.get("SONAR_TOKEN"):
+            return None
+        return sonar_fetch.build_parser().parse_args(
+            [
+                "--project-key", a.sonar_project_key,
+                "--pr", str(a.pr),
+                "--out", self.path("sonar"),
+                "--delta", self.path("delta"),
+                *shlex.split(a.sonar_args),
+            ]
+        )
+
+    def sonar_wait(self):
+        sargs = self.sonar_args()
+        if sargs is None:
+            return None
+        with tracing.span("sonar_wait", "stage"):
+            return sonar_fetch.wait_analysis(sargs, os.environ["SONAR_TOKEN"])
+
+    def sonar(self, delta: dict, waited=None) -> dict:
+        sargs = self.sonar_args()
+        if sargs is None:
+            # Mismo stub que usa el workflow cuando Sonar no corre (PRs de fork)
+            return sonar_fetch.stub_sonar()
+        return sonar_fetch.fetch_sonar(sargs, os.environ["SONAR_TOKEN"], delta, waited)
+
+    def select_policy(self, delta: dict) -> str:
+        selected = policy_select.select_policy(delta, self.args.web_policy, self.args.tooling_policy)
+        print(f"Selected policy: {selected}")
+        return selected
+
+    def evidence(self, delta: dict, tests: dict, sonar: dict, risk: dict, policy_result=None) -> dict:
+        a = self.args
+        return build_evidence_pack.build_evidence(a.repo, a.pr, a.base, a.head, delta, tests, sonar, risk, policy_result)
+
+    def policy(self, evidence: dict, risk: dict, selected: str) -> dict:
+        return policy_eval.evaluate(evidence, risk, policy_eval.load_yaml(selected))
+
+    def gate(self, policy_result: dict) -> bool:
+        mode, decision, blocked = gate_enforce.gate_decision(policy_result)
+        print(f"[gate] mode={mode} decision={decision}")
+        if blocked:
+            print("[gate] BLOCK in enforcing mode -> failing job")
+        else:
+            print("[gate] ok")
+        return blocked
+
+    def gate_or_stop(self, policy_result: dict):
+        if self.gate(policy_result):
+            raise dag.Stop()
+
+    def report(self, evidence: dict) -> str:
+        md = pr_comment.build_markdown(evidence, self.args.marker)
+        print("Rendered QualityRisk report markdown.")
+        return md
+
+    def comment_lookup(self):
+        # Búsqueda del comentario existente (paginada) mientras corre el resto
+        a = self.args
+        token = os.environ.get("GITHUB_TOKEN")
+        if not token:
+            return None
+        try:
+            with tracing.span("comment_lookup", "stage"):
+                return pr_comment.find_existing_comment(a.repo, a.pr, token, a.marker)
+        except requests.HTTPError as e:
+            return e
+
+    def comment(self, md: str, lookup=None, looked_up: bool = False):
+        # looked_up: `lookup` es el resultado de comment_lookup (id, None o HTTPError)
+        a = self.args
+
+        def found(*_):
+            if isinstance(lookup, Exception):
+                raise lookup
+            return lookup
+
+        with tracing.span("comment", "stage"):
+            pr_comment.post_comment(a.repo, a.pr, md, a.marker, found if looked_up else pr_comment.find_existing_comment)
+
+    def step(self, stage: str, fn, *args):
+        with tracing.span(stage, "stage"):
+            result = fn(*args)
+        self.emit(stage, result)
+        return result
+
+    def run(self) -> int:
+        try:
+            return self.run_async() if self.args.use_async else self.run_sequential()
+        finally:
+            if self.args.trace_out:
+                tracing.write_chrome(self.args.trace_out)
+                print(f"Wrote Chrome trace to {self.args.trace_out}")
+
+    def run_sequential(self) -> int:
+
+        tests = self.step("tests", self.tests)
+        delta = self.step("delta", self.delta)
+        self.step("impact", self.impact, delta)
+        selected = self.step("policy_select", self.select_policy, delta)
+        sonar = self.step("sonar", self.sonar, delta)
+        risk = self.step("risk", risk_score.compute_risk, delta, tests, sonar)
+        evidence = self.step("evidence", self.evidence, delta, tests, sonar, risk)
+        policy_result = self.step("policy", self.policy, evidence, risk, selected)
+
+        if self.gate(policy_result):
+            # Como el workflow: se corta aquí (sin evidence final ni comentario)
+            self.write_all()
+            return 1
+
+        evidence = self.step("evidence", self.evidence, delta, tests, sonar, risk, policy_result)
+        md = self.step("report", self.report, evidence)
+
+        self.write_all()
+
+        if self.args.comment:
+            self.comment(md)
+        return 0
+
+    def run_async(self) -> int:
+        # Mismas etapas como DAG: tests, delta, espera de Sonar y búsqueda del
+        # comentario arrancan a la vez; el resto en cuanto tiene sus entradas.
+        S = dag.Stage
+        stages = [
+            S("tests", partial(self.step, "tests", self.tests)),
+            S("delta", partial(self.step, "delta", self.delta)),
+            S("sonar_wait", self.sonar_wait),
+            S("impact", partial(self.step, "impact", self.impact), ("delta",)),
+            S("policy_select", partial(self.step, "policy_select", self.select_policy), ("delta",)),
+            S("sonar", partial(self.step, "sonar", self.sonar), ("delta", "sonar_wait")),
+            S("risk", partial(self.step, "risk", risk_score.compute_risk), ("delta", "tests", "sonar")),
+            S("evidence", partial(self.step, "evidence", self.evidence), ("delta", "tests", "sonar", "risk")),
+            S("policy", partial(self.step, "policy", self.policy), ("evidence", "risk", "policy_select")),
+            S("gate", self.gate_or_stop, ("policy",)),
+            S(
+                "evidence_final",
+                partial(self.step, "evidence", self.evidence),
+                ("delta", "tests", "sonar", "risk", "policy"),
+                after=("gate",),
+            ),
+            S("report", partial(self.step, "report", self.report), ("evidence_final",)),
+        ]
+        if self.args.comment:
+            stages.append(S("comment_lookup", self.comment_lookup))
+
+        done = dag.run_dag(stages)
+        print("[dag] stages:")
+        for line in dag.report_lines(done):
+            print(line)
+
+        self.write_all()
+        if done["gate"].status == "stopped":
+            return 1
+
+        if self.args.comment:
+            self.comment(done["report"].result, done["comment_lookup"].result, looked_up=True)
+        return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="qualityrisk")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the whole pipeline in-process")
+    run.add_argument("--repo", required=True, help="owner/repo")
+    run.add_argument("--pr", required=True, type=int)
+    run.add_argument("--base", required=True)
+    run.add_argument("--head", required=True)
+    run.add_argument("--out-dir", default="qualityrisk/out")
+    run.add_argument("--web-policy", default="qualityrisk/rules/policy_web_static_v1.yml")
+    run.add_argument("--tooling-policy", default="qualityrisk/rules/policy_qualityrisk_tooling_bootstrap_v1.yml")
+    run.add_argument("--tests-cmd", default=None, help="Test command (shell-quoted), e.g. 'npm test'")
+    run.add_argument("--tests-name", default="npm_test")
+    run.add_argument("--tests-manifest", default="package.json", help="Tests are skipped when this file is missing ('' = always run)")
+    run.add_argument("--tests-args", default="", help="Extra run_cmd_capture.py options")
+    run.add_argument("--delta-args", default="", help="Extra delta_analyzer.py options")
+    run.add_argument("--impact-args", default="", help="Extra impact_select.py options")
+    run.add_argument("--sonar-project-key", default=os.environ.get("SONAR_PROJECT_KEY") or None)
+    run.add_argument("--sonar-args", default="", help="Extra sonar_fetch.py options")
+    run.add_argument("--marker", default=pr_comment.DEFAULT_MARKER)
+    run.add_argument("--comment", action="store_true", help="Post/update the PR comment (needs GITHUB_TOKEN)")
+    run.add_argument("--write-each", action="store_true", help="Write each artifact as soon as its stage finishes")
+    run.add_argument("--no-write", action="store_true", help="Do not write artifacts at the end")
+    run.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Run independent stages concurrently (asyncio DAG) and print the critical path",
+    )
+    run.add_argument("--trace-out", default=None, help="Write a Chrome trace-event JSON of all spans")
+    args = ap.parse_args()
+
+    sys.exit(Pipeline(args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Listado de ficheros del repo (índice de git, o os.scandir sin git) y clave
+# por árbol para las caches de descubrimiento de tests e impacto.
+import os
+import re
+import subprocess
+
+import tracing
+
+# Equivalente a los antiguos TEST_FILE_PATTERNS en una sola regex (re.match)
+TEST_FILE_RE = re.compile(
+    r".*/__tests__/.*"
+    r"|.*\.(?:test|spec)\.(?:js|jsx|ts|tsx)$"
+    r"|.*test_.*\.py$"
+)
+
+# Directorios que el fallback sin git no recorre
+PRUNE_DIRS = {".git", "node_modules", ".venv", "venv", ".tox", "__pycache__", "dist", "build", "coverage"}
+
+
+def git_out(root: str, *args: str):
+    cmd = ["git", "-C", root, *args]
+    try:
+        with tracing.cmd_span(["git", *args]) as span:
+            proc = subprocess.run(cmd, capture_output=True)
+            span["exit_code"] = proc.returncode
+    except OSError:
+        return None
+    return proc.stdout if proc.returncode == 0 else None
+
+
+def tree_sha(root: str, worktree: bool = False):
+    # SHA del árbol de HEAD, sólo si el índice (y con `worktree`, también los
+    # ficheros versionados) coincide con HEAD; si no, no hay clave fiable
+    out = git_out(root, "rev-parse", "HEAD^{tree}")
+    if out is None or git_out(root, "diff-index", "--cached", "--quiet", "HEAD") is None:
+        return None
+    if worktree and git_out(root, "diff", "--quiet") is None:
+        return None
+    return out.decode().strip()
+
+
+def git_tracked_files(root: str):
+    out = git_out(root, "ls-files", "-z", "--cached")
+    if out is None:
+        return None
+    return [p for p in out.decode("utf-8", "replace").split("\0") if p]
+
+
+def tracked_blobs(root: str):
+    # path -> SHA del blob en el índice de git (None sin git)
+    out = git_out(root, "ls-files", "-s", "-z")
+    if out is None:
+        return None
+    blobs = {}
+    for rec in out.split(b"\0"):
+        if rec:
+            info, path = rec.split(b"\t", 1)
+            blobs[path.decode("utf-8", "replace")] = info.split()[1].decode()
+    return blobs
+
+
+def walk_files(root: str):
+    # Fallback sin git: os.scandir podando node_modules y compañía
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel) if rel else root)
+        except OSError:
+            continue
+        with it:
+            for e in sorted(it, key=lambda e: e.name):
+                p = f"{rel}/{e.name}" if rel else e.name
+                if e.is_dir(follow_symlinks=False):
+                    if e.name not in PRUNE_DIRS:
+                        stack.append(p)
+                elif e.is_file():
+                    yield p
+
+
+def list_files(root: str) -> list[str]:
+    files = git_tracked_files(root)
+    return files if files is not None else list(walk_files(root))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Ingesta de resultados estructurados (JUnit XML y TAP) para test_report.json:
+# estado y duración por test, los N más lentos y totales por suite.
+import glob
+import heapq
+import re
+import xml.etree.ElementTree as ET
+
+MAX_MESSAGE_CHARS = 500
+
+TAP_POINT_RE = re.compile(r"^(?P<indent>\s*)(?P<not>not )?ok\b(?:\s+(?P<num>\d+))?\s*(?:-\s*)?(?P<desc>[^#]*?)\s*(?:#\s*(?P<directive>\w+)\b.*)?$")
+TAP_DURATION_RE = re.compile(r"^\s+duration_ms:\s*(?P<ms>[0-9.]+)")
+
+
+def local_tag(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def new_suite(name: str) -> dict:
+    return {"name": name, "tests": 0, "passed": 0, "failed": 0, "errors": 0, "skipped": 0, "duration_ms": 0.0}
+
+
+def add_test(suite: dict, test: dict):
+    suite["tests"] += 1
+    key = {"passed": "passed", "failed": "failed", "error": "errors", "skipped": "skipped"}[test["status"]]
+    suite[key] += 1
+    suite["duration_ms"] += test["duration_ms"] or 0.0
+
+
+def seconds_to_ms(value) -> float | None:
+    try:
+        return round(float(value) * 1000.0, 3)
+    except (TypeError, ValueError):
+        return None
+
+
+def junit_status(case) -> tuple[str, str | None]:
+    for child in case:
+        tag = local_tag(child.tag)
+        if tag in ("failure", "error"):
+            msg = child.get("message") or (child.text or "").strip()
+            return ("failed" if tag == "failure" else "error"), (msg[:MAX_MESSAGE_CHARS] or None)
+        if tag == "skipped":
+            return "skipped", child.get("message")
+    return "passed", None
+
+
+def parse_junit(path: str):
+    # iterparse: cada <testcase> se procesa al cerrarse y se suelta del árbol,
+    # así la memoria no crece con el tamaño del informe.
+    suites = []
+    stack = []
+    suite_stack = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        tag = local_tag(elem.tag)
+        if event == "start":
+            stack.append(elem)
+            if tag == "testsuite":
+                suite_stack.append(new_suite(elem.get("name") or path))
+            continue
+
+        stack.pop()
+        if tag == "testcase":
+            status, message = junit_status(elem)
+            test = {
+                "suite": suite_stack[-1]["name"] if suite_stack else path,
+                "classname": elem.get("classname"),
+                "name": elem.get("name") or "",
+                "status": status,
+                "duration_ms": seconds_to_ms(elem.get("time")),
+            }
+            if message:
+                test["message"] = message
+            if not suite_stack:
+                suite_stack.append(new_suite(path))
+            add_test(suite_stack[-1], test)
+            yield "test", test
+        elif tag == "testsuite":
+            suite = suite_stack.pop()
+            nested = suite.pop("_nested", False)
+            if suite_stack:
+                suite_stack[-1]["_nested"] = True
+            if suite["tests"] == 0 and not nested and elem.get("tests"):
+                # Sin <testcase> (informes resumidos): totales de los atributos
+                suite["tests"] = int(elem.get("tests") or 0)
+                suite["failed"] = int(elem.get("failures") or 0)
+                suite["errors"] = int(elem.get("errors") or 0)
+                suite["skipped"] = int(elem.get("skipped") or 0)
+                suite["passed"] = max(0, suite["tests"] - suite["failed"] - suite["errors"] - suite["skipped"])
+                suite["duration_ms"] = seconds_to_ms(elem.get("time")) or 0.0
+            # Un <testsuite> contenedor no suma: sus hijos ya se cuentan
+            if suite["tests"] or not nested:
+                suites.append(suite)
+        else:
+            continue
+
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+    for suite in suite_stack:
+        suite.pop("_nested", None)
+        suites.append(suite)
+    for suite in suites:
+        suite["duration_ms"] = round(suite["duration_ms"], 3)
+        yield "suite", suite
+
+
+class TapParser:
+    # Se alimenta línea a línea (fichero o stdout en vivo). Los test points con
+    # subtests indentados (TAP 14, node --test) son suites: sólo cuentan las hojas.
+    def __init__(self, name: str):
+        self.suite = new_suite(name)
+        self.tests = []
+        self.children = {}
+        self.last = None
+
+    def feed_line(self, line: str):
+        m = TAP_POINT_RE.match(line.rstrip("\n"))
+        if m:
+            depth = len(m.group("indent").expandtabs(4))
+            is_suite = self.children.pop(depth, False)
+            for d in list(self.children):
+                if d > depth:
+                    del self.children[d]
+            for d in range(0, depth):
+                self.children[d] = True
+            directive = (m.group("directive") or "").upper()
+            if is_suite:
+                self.last = None
+                return
+            if directive in ("SKIP", "TODO"):
+                status = "skipped"
+            else:
+                status = "failed" if m.group("not") else "passed"
+            self.last = {
+                "suite": self.suite["name"],
+                "classname": None,
+                "name": m.group("desc") or f"test {m.group('num') or len(self.tests) + 1}",
+                "status": status,
+                "duration_ms": None,
+            }
+            self.tests.append(self.last)
+            return
+        d = TAP_DURATION_RE.match(line)
+        if d and self.last is not None and self.last["duration_ms"] is None:
+            self.last["duration_ms"] = round(float(d.group("ms")), 3)
+
+    def feed_text(self, text: str):
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def results(self):
+        for test in self.tests:
+            add_test(self.suite, test)
+            yield "test", test
+        self.suite["duration_ms"] = round(self.suite["duration_ms"], 3)
+        yield "suite", self.suite
+
+
+def parse_tap(path: str):
+    parser = TapParser(path)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parser.feed_line(line)
+    yield from parser.results()
+
+
+def expand(patterns: list[str]) -> list[str]:
+    out = []
+    for pat in patterns or []:
+        hits = sorted(glob.glob(pat, recursive=True)) if glob.has_magic(pat) else [pat]
+        out.extend(h for h in hits if h not in out)
+    return out
+
+
+def collect(junit: list[str], tap: list[str], tap_parsers: list | None = None, slowest_n: int = 10) -> dict | None:
+    sources = [(p, "junit", lambda p=p: parse_junit(p)) for p in expand(junit)]
+    sources += [(p, "tap", lambda p=p: parse_tap(p)) for p in expand(tap)]
+    sources += [(t.suite["name"], "tap", t.results) for t in tap_parsers or []]
+    if not sources:
+        return None
+
+    tests, suites, errors, formats = [], [], [], []
+    for path, fmt, parse in sources:
+        seen = len(tests)
+        try:
+            for kind, item in parse():
+                (tests if kind == "test" else suites).append(item)
+        except (OSError, ET.ParseError) as e:
+            # Informe truncado (p.ej. proceso matado): se conserva lo ya leído
+            errors.append({"path": path, "error": str(e)})
+            if len(tests) == seen:
+                continue
+            partial = new_suite(path)
+            for test in tests[seen:]:
+                add_test(partial, test)
+            partial["duration_ms"] = round(partial["duration_ms"], 3)
+            suites.append(partial)
+        if fmt not in formats:
+            formats.append(fmt)
+
+    totals = new_suite("total")
+    del totals["name"]
+    for suite in suites:
+        for k in totals:
+            totals[k] += suite[k]
+    totals["duration_ms"] = round(totals["duration_ms"], 3)
+
+    timed = (t for t in tests if t["duration_ms"] is not None)
+    return {
+        "formats": formats,
+        "sources": [p for p, _, _ in sources],
+        "errors": errors,
+        "totals": totals,
+        "suites": suites,
+        "slowest": heapq.nlargest(slowest_n, timed, key=lambda t: t["duration_ms"]),
+        "tests": tests,
+    }
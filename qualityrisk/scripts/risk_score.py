@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 import argparse
-import json
 from datetime import datetime, timezone
 from pathlib import Path
 
+import tracing
+from issue_table import delta_issues
+
 try:
     import yaml  # PyYAML
 except Exception:
     yaml = None
 
 def load_json(p: str):
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return tracing.load_json(p)
 
 def load_yaml(p: str):
     if not p:
@@ -57,9 +58,7 @@ def get_sonar_signals(sonar: dict) -> dict:
     qg = (sonar.get("qualityGate") or {})
     qg_status = str(qg.get("status") or "NONE").upper()
 
-    issues = sonar.get("issues_filtered_by_delta")
-    if issues is None:
-        issues = sonar.get("issues", []) or []
+    issues = delta_issues(sonar)
 
     sev_counts = {}
     for it in issues or []:
@@ -75,20 +74,7 @@ def infer_scope_from_policy(policy: dict | None) -> str:
     scope = meta.get("scope") or policy.get("scope")
     return str(scope or "unknown").lower()
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--delta", required=True)
-    ap.add_argument("--tests", required=True)
-    ap.add_argument("--sonar", required=True)
-    ap.add_argument("--policy", default=None, help="Optional policy YAML to infer scope/profile")
-    ap.add_argument("--out", required=True)
-    args = ap.parse_args()
-
-    delta = load_json(args.delta)
-    tests = load_json(args.tests)
-    sonar = load_json(args.sonar)
-    policy = load_yaml(args.policy) if args.policy else None
-
+def compute_risk(delta: dict, tests: dict, sonar: dict, policy: dict | None = None) -> dict:
     scope = infer_scope_from_policy(policy)
     if scope == "unknown":
         # fallback simple
@@ -179,10 +165,26 @@ def main():
             "sonar": {"quality_gate": s["qg_status"], "sev_counts": sev},
         },
     }
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--delta", required=True)
+    ap.add_argument("--tests", required=True)
+    ap.add_argument("--sonar", required=True)
+    ap.add_argument("--policy", default=None, help="Optional policy YAML to infer scope/profile")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    delta = load_json(args.delta)
+    tests = load_json(args.tests)
+    sonar = load_json(args.sonar)
+    policy = load_yaml(args.policy) if args.policy else None
+
+    out = compute_risk(delta, tests, sonar, policy)
 
     Path(args.out).parent.mkdir(parents=True, exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, indent=2, ensure_ascii=False)
+    tracing.dump_json(out, args.out, indent=2, ensure_ascii=False)
 
 if __name__ == "__main__":
     main()
@@ -1,116 +1,704 @@
 #!/usr/bin/env python3
 import argparse
+import codecs
+import hashlib
+import io
 import json
 import os
 import re
+import shlex
+import shutil
+import signal
 import subprocess
+import sys
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from pathlib import Path
+
+import disk_cache
+import impact_select
+import result_ingest
+import tracing
+from delta_analyzer import IgnoreMatcher
+from repo_files import TEST_FILE_RE, list_files, tracked_blobs, tree_sha
 
 MAX_CAPTURE_CHARS = 20000
+READ_CHUNK = 64 * 1024
+MAX_SCAN_CARRY = 64 * 1024
+SCAN_OVERLAP = 256  # > la señal más larga ("Collected 0 items")
+KILL_GRACE_S = 10.0
 
-NO_TESTS_PATTERNS = [
-    re.compile(r"\bNo tests found\b", re.IGNORECASE),
-    re.compile(r"\b0 tests\b", re.IGNORECASE),
-    re.compile(r"\bCollected 0 items\b", re.IGNORECASE),
-]
-
-OUTPUT_TEST_SIGNALS = [
-    re.compile(r"\bPASS\b"),
-    re.compile(r"\bFAIL\b"),
-    re.compile(r"\btests?\b", re.IGNORECASE),
-    re.compile(r"\bpassed\b", re.IGNORECASE),
-    re.compile(r"\bfailing\b", re.IGNORECASE),
-]
-
-TEST_FILE_PATTERNS = [
-    re.compile(r".*/__tests__/.*"),
-    re.compile(r".*\.test\.(js|jsx|ts|tsx)$"),
-    re.compile(r".*\.spec\.(js|jsx|ts|tsx)$"),
-    re.compile(r".*test_.*\.py$"),
-]
-
-def trunc(s: str):
-    if s is None:
-        return "", False
-    if len(s) <= MAX_CAPTURE_CHARS:
-        return s, False
-    return s[-MAX_CAPTURE_CHARS:] + "\n...[truncated]...", True
-
-def find_test_files(root: str) -> list[str]:
-    hits = []
-    for p in Path(root).rglob("*"):
-        if not p.is_file():
-            continue
-        s = str(p).replace("\\", "/")
-        for pat in TEST_FILE_PATTERNS:
-            if pat.match(s):
-                hits.append(s)
+# Una sola alternación para todas las señales de salida; cada grupo con
+# nombre indica qué señales activa y se cuenta por separado.
+OUTPUT_SIGNALS_RE = re.compile("|".join([
+    r"(?P<no_tests_found>(?i:\bNo tests found\b))",
+    r"(?P<zero_tests>(?i:\b0 tests\b))",
+    r"(?P<collected_zero>(?i:\bCollected 0 items\b))",
+    r"(?P<PASS>\bPASS\b)",
+    r"(?P<FAIL>\bFAIL\b)",
+    r"(?P<test>(?i:\btests?\b))",
+    r"(?P<passed>(?i:\bpassed\b))",
+    r"(?P<failing>(?i:\bfailing\b))",
+]))
+
+SIGNAL_GROUPS = {
+    # "No tests found" / "0 tests" también contienen la palabra "tests"
+    "no_tests_found": ("output_says_no_tests", "output_mentions_tests"),
+    "zero_tests": ("output_says_no_tests", "output_mentions_tests"),
+    "collected_zero": ("output_says_no_tests",),
+    "PASS": ("output_mentions_tests",),
+    "FAIL": ("output_mentions_tests",),
+    "test": ("output_mentions_tests",),
+    "passed": ("output_mentions_tests",),
+    "failing": ("output_mentions_tests",),
+}
+
+TOKEN_GROUPS = ("PASS", "FAIL", "passed", "failing")
+
+MAX_TEST_FILES = 200
+
+RESULT_CACHE_VERSION = "r2"
+
+# Cache de resultados, ficheros fuera del índice de dependencias: éstos sí
+# cuentan (datos y helpers de los tests) y éstos nunca (docs, estilos) salvo
+# que un test los importe. Ampliables con --cache-(ir)relevant-glob, `!` re-incluye.
+CACHE_RELEVANT_GLOBS = ["test/", "tests/", "__tests__/", "spec/", "fixtures/", "__fixtures__/", "testdata/", "__snapshots__/"]
+CACHE_IRRELEVANT_GLOBS = ["docs/", "*.md", "*.rst", "css/", "*.css", "*.scss", "LICENSE*", ".github/"]
+
+class TailBuffer:
+    # Sólo guarda los últimos `limit` caracteres: memoria constante aunque el
+    # comando imprima gigas. value() equivale al antiguo trunc() del texto completo.
+    def __init__(self, limit: int = MAX_CAPTURE_CHARS):
+        self.limit = limit
+        self.parts = deque()
+        self.size = 0
+        self.total = 0
+        self.closed = False
+
+    def append(self, s: str):
+        if not s or self.closed:
+            return
+        self.parts.append(s)
+        self.size += len(s)
+        self.total += len(s)
+        while self.parts and self.size - len(self.parts[0]) >= self.limit:
+            self.size -= len(self.parts.popleft())
+
+    def value(self):
+        s = "".join(self.parts)
+        if self.total <= self.limit:
+            return s, False
+        return s[-self.limit:] + "\n...[truncated]...", True
+
+class SignalScanner:
+    # Una pasada por chunk mientras llega la salida, por líneas completas (la
+    # línea parcial se arrastra al siguiente chunk) y por stream. Cada señal
+    # queda disponible (con su instante) en cuanto aparece. Con `tap`, las
+    # líneas de stdout alimentan además un TapParser.
+    def __init__(self, started: float | None = None, tap=None):
+        self.started = started if started is not None else time.time()
+        self.tap = tap
+        self.carry = {}
+        self.signals = {"output_says_no_tests": False, "output_mentions_tests": False}
+        self.first_seen_ms = {}
+        self.counts = {g: 0 for g in TOKEN_GROUPS}
+
+    @property
+    def says_no_tests(self) -> bool:
+        return self.signals["output_says_no_tests"]
+
+    @property
+    def mentions_tests(self) -> bool:
+        return self.signals["output_mentions_tests"]
+
+    def scan(self, text: str, pos: int = 0, endpos: int | None = None) -> int:
+        # Cuenta las coincidencias que empiezan en [pos, endpos) (`\b` sí mira
+        # el carácter anterior a pos). Devuelve dónde acaba la última contada.
+        end = pos
+        for m in OUTPUT_SIGNALS_RE.finditer(text, pos):
+            if endpos is not None and m.start() >= endpos:
                 break
-        if len(hits) >= 200:
+            end = m.end()
+            group = m.lastgroup
+            if group in self.counts:
+                self.counts[group] += 1
+            for sig in SIGNAL_GROUPS[group]:
+                if not self.signals[sig]:
+                    self.signals[sig] = True
+                    self.first_seen_ms[sig] = int((time.time() - self.started) * 1000)
+        return end
+
+    def feed_tap(self, stream: str, text: str):
+        if text and self.tap is not None and stream == "stdout":
+            self.tap.feed_text(text)
+
+    def feed(self, stream: str, text: str):
+        # carry: (texto pendiente, desde dónde se escanea, desde dónde va al TAP)
+        rest, scan_pos, tap_pos = self.carry.get(stream, ("", 0, 0))
+        buf = rest + text
+        cut = buf.rfind("\n") + 1
+        if cut == 0 and len(buf) > MAX_SCAN_CARRY:
+            # Línea sin fin: corte forzado. Se escanea todo pero sólo cuenta lo
+            # que empieza antes del corte; desde el corte (más 1 carácter de
+            # contexto para `\b`) se arrastra y se vuelve a escanear.
+            cut = len(buf) - SCAN_OVERLAP
+            end = self.scan(buf, scan_pos, cut)
+            self.feed_tap(stream, buf[tap_pos:cut])
+            self.carry[stream] = (buf[cut - 1:], max(1, end - cut + 1), 1)
+            return
+        if cut:
+            self.scan(buf[:cut], scan_pos)
+            self.feed_tap(stream, buf[tap_pos:cut])
+            self.carry[stream] = (buf[cut:], 0, 0)
+        else:
+            self.carry[stream] = (buf, scan_pos, tap_pos)
+
+    def close(self):
+        for stream, (rest, scan_pos, tap_pos) in self.carry.items():
+            self.scan(rest, scan_pos)
+            self.feed_tap(stream, rest[tap_pos:])
+        self.carry = {}
+
+def pump(fd: int, tail: TailBuffer, scanner: SignalScanner, stream: str, lock: threading.Lock, sink=None):
+    # universal newlines, igual que el antiguo capture_output(text=True)
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")("replace"), translate=True)
+    while True:
+        chunk = os.read(fd, READ_CHUNK)
+        if sink is not None and chunk:
+            try:
+                sink.write(chunk)
+                sink.flush()
+            except OSError:
+                sink = None  # el log cerrado no debe cortar la captura
+        text = decoder.decode(chunk, final=not chunk)
+        with lock:
+            tail.append(text)
+            scanner.feed(stream, text)
+        if not chunk:
+            break
+
+class Watchdog:
+    # Al vencer `timeout_s` manda SIGTERM al grupo de procesos del comando y,
+    # si sigue vivo tras `grace_s`, SIGKILL.
+    def __init__(self, pgid: int, timeout_s: float, grace_s: float = KILL_GRACE_S):
+        self.pgid = pgid
+        self.timeout_s = timeout_s
+        self.grace_s = grace_s
+        self.fired_at = None
+        self.signals = []
+        self.done = threading.Event()
+        self.timer = threading.Timer(timeout_s, self.fire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def kill(self, sig: int):
+        try:
+            os.killpg(self.pgid, sig)
+            self.signals.append(signal.Signals(sig).name)
+        except ProcessLookupError:
+            pass
+
+    def fire(self):
+        self.fired_at = time.time()
+        self.kill(signal.SIGTERM)
+        if not self.done.wait(self.grace_s):
+            self.kill(signal.SIGKILL)
+
+    def pipes_abandoned(self) -> bool:
+        # Un descendiente que salió del grupo puede mantener los pipes abiertos
+        return self.fired_at is not None and time.time() > self.fired_at + self.grace_s + 1.0
+
+    def stop(self):
+        self.done.set()
+        self.timer.cancel()
+
+    def report(self) -> dict:
+        return {
+            "timeout_s": self.timeout_s,
+            "timed_out": self.fired_at is not None,
+            "signals_sent": self.signals,
+        }
+
+def rusage_report(ru, wall_s: float) -> dict:
+    # ru_maxrss: KiB en Linux, bytes en macOS
+    max_rss_kb = ru.ru_maxrss // 1024 if sys.platform == "darwin" else ru.ru_maxrss
+    cpu_s = ru.ru_utime + ru.ru_stime
+    return {
+        "user_cpu_ms": int(ru.ru_utime * 1000),
+        "sys_cpu_ms": int(ru.ru_stime * 1000),
+        "cpu_utilization": round(cpu_s / wall_s, 3) if wall_s > 0 else None,
+        "max_rss_kb": int(max_rss_kb),
+        "voluntary_ctx_switches": ru.ru_nvcsw,
+        "involuntary_ctx_switches": ru.ru_nivcsw,
+    }
+
+def wait_child(proc: subprocess.Popen):
+    # os.wait4 da el rusage del hijo más el de los descendientes que él haya
+    # esperado; sin wait4 (Windows) sólo hay código de salida.
+    if not hasattr(os, "wait4"):
+        return proc.wait(), None
+    while True:
+        try:
+            _, status, ru = os.wait4(proc.pid, 0)
             break
+        except InterruptedError:
+            continue
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, ru
+
+def run_streaming(
+    cmd: list[str],
+    passthrough: bool = True,
+    tap=None,
+    timeout_s: float | None = None,
+    tail_limit: int = MAX_CAPTURE_CHARS,
+    env: dict | None = None,
+    sinks: tuple | None = None,
+):
+    # Lee stdout/stderr del hijo incrementalmente (un hilo por pipe) hacia
+    # buffers de cola acotados, con eco en vivo al log de CI (o a `sinks`,
+    # ficheros binarios para stdout/stderr). Con timeout, el comando va en su
+    # propio grupo de procesos para poder matar el árbol entero.
+    if sinks is None:
+        sinks = (sys.stdout.buffer, sys.stderr.buffer) if passthrough else (None, None)
+    scanner = SignalScanner(tap=tap)
+    started = time.time()
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, start_new_session=bool(timeout_s), env=env
+    )
+    watchdog = Watchdog(proc.pid, timeout_s) if timeout_s else None
+    out_tail, err_tail = TailBuffer(tail_limit), TailBuffer(tail_limit)
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(
+            target=pump,
+            args=(proc.stdout.fileno(), out_tail, scanner, "stdout", lock, sinks[0]),
+            daemon=True,
+        ),
+        threading.Thread(
+            target=pump,
+            args=(proc.stderr.fileno(), err_tail, scanner, "stderr", lock, sinks[1]),
+            daemon=True,
+        ),
+    ]
+    for t in threads:
+        t.start()
+    abandoned = False
+    for t in threads:
+        while t.is_alive() and not abandoned:
+            t.join(0.5)
+            abandoned = watchdog is not None and watchdog.pipes_abandoned()
+    if abandoned:
+        # Se deja de leer: lo capturado hasta aquí es el informe parcial
+        with lock:
+            out_tail.closed = err_tail.closed = True
+    else:
+        proc.stdout.close()
+        proc.stderr.close()
+    returncode, ru = wait_child(proc)
+    wall_s = time.time() - started
+    if watchdog is not None:
+        watchdog.stop()
+    with lock:
+        scanner.close()
+    resources = rusage_report(ru, wall_s) if ru is not None else None
+    return returncode, out_tail, err_tail, scanner, resources, watchdog
+
+def find_test_files(root: str, cache_dir: str | None = None) -> list[str]:
+    # Cache por árbol en <cache-dir>/test-files (LRU, ver cache_evict en capture)
+    tree = tree_sha(root) if cache_dir else None
+    files_cache = os.path.join(cache_dir, "test-files") if tree else None
+    if files_cache:
+        cached = disk_cache.cache_get(files_cache, tree)
+        if cached is not None:
+            return cached
+
+    files = list_files(root)
+    prefix = "" if root in (".", "") else root.rstrip("/") + "/"
+
+    hits = []
+    for p in files:
+        if TEST_FILE_RE.match(p):
+            hits.append(prefix + p)
+            if len(hits) >= MAX_TEST_FILES:
+                break
+
+    if files_cache:
+        disk_cache.cache_put(files_cache, tree, hits)
     return hits
 
-def main():
+def relevant_digest(root: str, cache_dir: str, relevant_globs=(), irrelevant_globs=()):
+    # Hash de los blobs de los paths relevantes para los tests; devuelve
+    # (digest, info) con la regla que decidió cada path contada en info["rules"]:
+    #   config      RUN_ALL_GLOBS (dependencias, config de runners)
+    #   reached     tests y todo lo que importan (índice de impact_select)
+    #   irrelevant  CACHE_IRRELEVANT_GLOBS + irrelevant_globs: no cuentan
+    #   relevant    CACHE_RELEVANT_GLOBS + relevant_globs: fixtures y helpers
+    #   unreached   código indexado al que no llega ningún test
+    #   unindexed   el resto de ficheros que el índice no cubre
+    # Sólo entran en el hash config, reached y relevant. Si el índice no ve
+    # tests, la clave es el árbol entero. Con el árbol sucio no hay clave fiable.
+    tree = tree_sha(root, worktree=True)
+    blobs = tracked_blobs(root) if tree else None
+    if blobs is None:
+        return None, {}
+    index, _, _ = impact_select.load_index(root, impact_select.JS_ROOTS, cache_dir)
+    if not index["tests"]:
+        return tree, {"digest": "tree", "relevant_files": len(blobs), "rules": {"tree": len(blobs)}}
+    deps = index["deps"]
+    reached = set()
+    stack = list(index["tests"])
+    while stack:
+        p = stack.pop()
+        if p not in reached:
+            reached.add(p)
+            stack.extend(deps.get(p, ()))
+    config = IgnoreMatcher(globs=impact_select.RUN_ALL_GLOBS)
+    irrelevant = IgnoreMatcher(globs=[*CACHE_IRRELEVANT_GLOBS, *irrelevant_globs])
+    relevant = IgnoreMatcher(globs=[*CACHE_RELEVANT_GLOBS, *relevant_globs])
+
+    h = hashlib.sha256()
+    rules = {}
+    count = 0
+    for path, blob in blobs.items():
+        if config.match(path):
+            rule = "config"
+        elif path in reached:
+            rule = "reached"
+        elif irrelevant.match(path):
+            rule = "irrelevant"
+        elif relevant.match(path):
+            rule = "relevant"
+        elif path in deps:
+            rule = "unreached"
+        else:
+            rule = "unindexed"
+        rules[rule] = rules.get(rule, 0) + 1
+        if rule in ("config", "reached", "relevant"):
+            h.update(f"{path}\0{blob}\0".encode("utf-8"))
+            count += 1
+    return h.hexdigest(), {"digest": "relevant", "relevant_files": count, "rules": dict(sorted(rules.items()))}
+
+def result_cache_key(digest: str, cmds: list[list[str]], args) -> str:
+    # La línea de comandos entera (y lo que cambia el informe) forma parte de la clave
+    spec = {
+        "version": RESULT_CACHE_VERSION,
+        "relevant": digest,
+        "relevant_globs": args.cache_relevant_glob,
+        "irrelevant_globs": args.cache_irrelevant_glob,
+        "name": args.name,
+        "cmds": cmds,
+        "junit": args.junit,
+        "tap": args.tap,
+        "tap_stdout": args.tap_stdout,
+        "slowest": args.slowest,
+        "timeout": args.timeout,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+def write_report(path: str, payload: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tracing.dump_json(payload, path, indent=2, ensure_ascii=False)
+
+def shard_commands(args) -> list[list[str]]:
+    if args.shard_cmd:
+        return [shlex.split(c) for c in args.shard_cmd]
+    if args.shards > 1:
+        # Plantilla: {index} (1..N) y {total} en cualquier argumento del comando
+        if not any("{index}" in part for part in args.cmd):
+            raise SystemExit("--shards needs a command template containing {index} (and optionally {total})")
+        return [
+            [part.replace("{index}", str(i)).replace("{total}", str(args.shards)) for part in args.cmd]
+            for i in range(1, args.shards + 1)
+        ]
+    return [args.cmd]
+
+def run_shard(index: int, total: int, cmd: list[str], args, passthrough: bool, spool: bool = False) -> dict:
+    # spool: la salida completa va a ficheros temporales (sh["spool"]) para
+    # volcarla entera al log al terminar; las colas sólo van al informe
+    env = None
+    if total > 1:
+        env = {**os.environ, "QUALITYRISK_SHARD_INDEX": str(index), "QUALITYRISK_SHARD_TOTAL": str(total)}
+    tap = None
+    if args.tap_stdout:
+        tap = result_ingest.TapParser(f"shard-{index}/stdout" if total > 1 else "stdout")
+    sinks = (tempfile.TemporaryFile(), tempfile.TemporaryFile()) if spool else None
+    started = time.time()
+    with tracing.cmd_span(cmd, shard=index) as span:
+        returncode, out_tail, err_tail, scanner, resources, watchdog = run_streaming(
+            cmd,
+            passthrough=passthrough,
+            tap=tap,
+            timeout_s=args.timeout,
+            tail_limit=max(1000, MAX_CAPTURE_CHARS // total),
+            env=env,
+            sinks=sinks,
+        )
+        span["exit_code"] = returncode
+    stdout, stdout_tr = out_tail.value()
+    stderr, stderr_tr = err_tail.value()
+    return {
+        "index": index,
+        "cmd": cmd,
+        "exit_code": returncode,
+        "duration_ms": int((time.time() - started) * 1000),
+        "timed_out": watchdog is not None and watchdog.report()["timed_out"],
+        "resources": resources,
+        "watchdog": watchdog.report() if watchdog is not None else None,
+        "scanner": scanner,
+        "tap": tap,
+        "stdout": stdout,
+        "stderr": stderr,
+        "truncated": {"stdout": stdout_tr, "stderr": stderr_tr},
+        "spool": sinks,
+    }
+
+def dump_spool(sh: dict):
+    # Salida completa del shard al log de CI, y se liberan los temporales
+    for f, dest in zip(sh.pop("spool"), (sys.stdout, sys.stderr)):
+        dest.flush()
+        f.seek(0)
+        shutil.copyfileobj(f, dest.buffer)
+        dest.buffer.flush()
+        f.close()
+
+def run_shards(cmds: list[list[str]], args) -> list[dict]:
+    # Un comando: salida en vivo como siempre. Varios: pool acotado de procesos;
+    # cada shard escribe su salida completa a un spool en disco que se vuelca
+    # agrupado al log al terminar (el informe sólo guarda las colas).
+    if len(cmds) == 1:
+        return [run_shard(1, 1, cmds[0], args, passthrough=not args.quiet)]
+    total = len(cmds)
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, total))
+    shards = []
+    with ThreadPoolExecutor(max_workers=jobs) as ex:
+        futs = [ex.submit(run_shard, i, total, cmd, args, False, not args.quiet) for i, cmd in enumerate(cmds, 1)]
+        for fut in as_completed(futs):
+            sh = fut.result()
+            shards.append(sh)
+            if not args.quiet:
+                print(f"--- shard {sh['index']}/{total}: {shlex.join(sh['cmd'])} (exit {sh['exit_code']}) ---", flush=True)
+                dump_spool(sh)
+            sh.pop("spool", None)
+    return sorted(shards, key=lambda sh: sh["index"])
+
+def merge_resources(shards: list[dict], wall_s: float) -> dict | None:
+    if any(sh["resources"] is None for sh in shards):
+        return None
+    if len(shards) == 1:
+        return shards[0]["resources"]
+    rs = [sh["resources"] for sh in shards]
+    user_ms = sum(r["user_cpu_ms"] for r in rs)
+    sys_ms = sum(r["sys_cpu_ms"] for r in rs)
+    return {
+        "user_cpu_ms": user_ms,
+        "sys_cpu_ms": sys_ms,
+        "cpu_utilization": round((user_ms + sys_ms) / 1000.0 / wall_s, 3) if wall_s > 0 else None,
+        "max_rss_kb": max(r["max_rss_kb"] for r in rs),
+        "voluntary_ctx_switches": sum(r["voluntary_ctx_switches"] for r in rs),
+        "involuntary_ctx_switches": sum(r["involuntary_ctx_switches"] for r in rs),
+    }
+
+def merge_output(shards: list[dict], stream: str) -> str:
+    if len(shards) == 1:
+        return shards[0][stream]
+    total = len(shards)
+    return "".join(
+        f"--- shard {sh['index']}/{total} (exit {sh['exit_code']}) ---\n{sh[stream]}" for sh in shards
+    )
+
+def skipped_report(name: str, reason: str) -> dict:
+    # test_report.json cuando no hay proyecto que testear (sin package.json)
+    return {
+        "name": name,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "duration_ms": 0,
+        "exit_code": 0,
+        "tests_present": False,
+        "tests_passed": False,
+        "signals": {
+            "has_test_files": False,
+            "test_files_sample": [],
+            "output_mentions_tests": False,
+            "output_says_no_tests": False
+        },
+        "stdout": "",
+        "stderr": reason,
+        "truncated": {"stdout": False, "stderr": False}
+    }
+
+def build_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser()
     ap.add_argument("--name", required=True)
     ap.add_argument("--out", required=True)
+    ap.add_argument("--cache-dir", default=None, help="Cache directory (test file discovery, dependency index, test results)")
+    ap.add_argument("--no-cache", action="store_true", help="Always run the command; do not read or store cached results")
+    ap.add_argument("--cache-max-bytes", type=int, default=256 * 1024 * 1024, help="Size limit of --cache-dir (LRU eviction)")
+    ap.add_argument(
+        "--cache-relevant-glob",
+        action="append",
+        default=[],
+        help="Extra files outside the dependency index that invalidate cached results, e.g. 'e2e/' (repeatable)",
+    )
+    ap.add_argument(
+        "--cache-irrelevant-glob",
+        action="append",
+        default=[],
+        help="Extra files that never invalidate cached results, e.g. 'assets/' ('!pattern' re-includes, repeatable)",
+    )
+    ap.add_argument("--junit", action="append", default=[], help="JUnit XML report path or glob (repeatable)")
+    ap.add_argument("--tap", action="append", default=[], help="TAP output file path or glob (repeatable)")
+    ap.add_argument("--tap-stdout", action="store_true", help="Parse the command stdout as TAP")
+    ap.add_argument("--slowest", type=int, default=10, help="Number of slowest tests to report")
+    ap.add_argument("--timeout", type=float, default=None, help="Kill the command (whole process group) after N seconds")
+    ap.add_argument("--shard-cmd", action="append", default=[], help="Shard command line (repeatable, shell-quoted)")
+    ap.add_argument("--shards", type=int, default=1, help="Run the command as a template N times ({index}, {total})")
+    ap.add_argument("--jobs", type=int, default=None, help="Max shards running at once (default: CPU count)")
+    ap.add_argument("--quiet", action="store_true", help="Do not echo the command output to the CI log")
     ap.add_argument("cmd", nargs=argparse.REMAINDER)
-    args = ap.parse_args()
+    return ap
+
+def parse_args(argv: list[str] | None = None):
+    args = build_parser().parse_args(argv)
 
     # Soporta: python script.py --name X --out Y -- npm test
     if args.cmd and args.cmd[0] == "--":
         args.cmd = args.cmd[1:]
 
-    if not args.cmd:
+    if not args.cmd and not args.shard_cmd:
         raise SystemExit("No command provided. Usage: run_cmd_capture.py --name X --out Y -- <command>")
+    return args
 
+def capture(args) -> dict:
     started = time.time()
     started_iso = datetime.now(timezone.utc).isoformat()
+    cmds = shard_commands(args)
 
-    proc = subprocess.run(args.cmd, text=True, capture_output=True)
+    # Cache de resultados: mismo contenido relevante + mismo comando -> mismo informe
+    results_cache = os.path.join(args.cache_dir, "test-results") if args.cache_dir and not args.no_cache else None
+    cache_info = None
+    if results_cache:
+        digest, digest_info = relevant_digest(".", args.cache_dir, args.cache_relevant_glob, args.cache_irrelevant_glob)
+        key = result_cache_key(digest, cmds, args) if digest else None
+        cache_info = {"hit": False, "key": key, **digest_info}
+        if key is None:
+            cache_info["reason"] = "dirty_worktree"
+        cached = disk_cache.cache_get(results_cache, key) if key else None
+        if cached is not None:
+            cached["cached"] = True
+            cached["cache"] = {**cache_info, "hit": True, "lookup_ms": int((time.time() - started) * 1000)}
+            if not args.quiet:
+                print(f"Cached test report {key[:12]} (from run started {cached.get('started_at')})", flush=True)
+            return cached
+
+    shards = run_shards(cmds, args)
     ended = time.time()
 
-    stdout, stdout_tr = trunc(proc.stdout or "")
-    stderr, stderr_tr = trunc(proc.stderr or "")
+    # Fusión: exit del primer shard que falla, señales de salida combinadas
+    returncode = next((sh["exit_code"] for sh in shards if sh["exit_code"] != 0), 0)
+    timed_out = any(sh["timed_out"] for sh in shards)
     duration_ms = int((ended - started) * 1000)
+    resources = merge_resources(shards, ended - started)
+
+    stdout = merge_output(shards, "stdout")
+    stderr = merge_output(shards, "stderr")
+    stdout_tr = any(sh["truncated"]["stdout"] for sh in shards)
+    stderr_tr = any(sh["truncated"]["stderr"] for sh in shards)
 
-    combined = (proc.stdout or "") + "\n" + (proc.stderr or "")
-    output_says_no_tests = any(rx.search(combined) for rx in NO_TESTS_PATTERNS)
-    output_mentions_tests = any(rx.search(combined) for rx in OUTPUT_TEST_SIGNALS)
+    scanners = [sh["scanner"] for sh in shards]
+    output_says_no_tests = all(sc.says_no_tests for sc in scanners)
+    output_mentions_tests = any(sc.mentions_tests for sc in scanners)
+    token_counts = {g: sum(sc.counts[g] for sc in scanners) for g in TOKEN_GROUPS}
+    first_seen_ms = {}
+    for sc in scanners:
+        for sig, ms in sc.first_seen_ms.items():
+            first_seen_ms[sig] = min(ms, first_seen_ms.get(sig, ms))
 
-    test_files = find_test_files(".")
+    test_files = find_test_files(".", args.cache_dir)
     has_test_files = len(test_files) > 0
 
-    if output_says_no_tests:
-        tests_present = False
-    else:
-        tests_present = bool(output_mentions_tests or has_test_files)
+    taps = [sh["tap"] for sh in shards if sh["tap"] is not None]
+    results = result_ingest.collect(args.junit, args.tap, taps or None, slowest_n=args.slowest)
+    totals = (results or {}).get("totals") or {}
 
-    tests_passed = bool(tests_present and proc.returncode == 0)
+    if totals.get("tests"):
+        # Resultados estructurados: mandan sobre las heurísticas de la salida
+        tests_source = "results"
+        tests_present = True
+        tests_passed = bool(returncode == 0 and not timed_out and not totals["failed"] and not totals["errors"])
+    else:
+        tests_source = "heuristics"
+        if output_says_no_tests:
+            tests_present = False
+        else:
+            tests_present = bool(output_mentions_tests or has_test_files)
+        tests_passed = bool(tests_present and returncode == 0 and not timed_out)
 
     payload = {
         "name": args.name,
         "started_at": started_iso,
         "duration_ms": duration_ms,
-        "exit_code": proc.returncode,
+        "exit_code": returncode,
         "tests_present": tests_present,
         "tests_passed": tests_passed,
+        "timed_out": timed_out,
+        "resources": resources,
         "signals": {
+            "tests_source": tests_source,
             "has_test_files": has_test_files,
             "test_files_sample": test_files[:25],
             "output_mentions_tests": output_mentions_tests,
             "output_says_no_tests": output_says_no_tests,
+            "output_token_counts": token_counts,
+            "output_first_seen_ms": first_seen_ms,
         },
         "stdout": stdout,
         "stderr": stderr,
         "truncated": {"stdout": stdout_tr, "stderr": stderr_tr},
     }
+    if results is not None:
+        payload["results"] = results
+    if len(shards) == 1:
+        if shards[0]["watchdog"] is not None:
+            payload["watchdog"] = shards[0]["watchdog"]
+    else:
+        payload["shards"] = [
+            {
+                "index": sh["index"],
+                "cmd": sh["cmd"],
+                "exit_code": sh["exit_code"],
+                "duration_ms": sh["duration_ms"],
+                "timed_out": sh["timed_out"],
+                "output_says_no_tests": sh["scanner"].says_no_tests,
+                "output_mentions_tests": sh["scanner"].mentions_tests,
+                "resources": sh["resources"],
+                "truncated": sh["truncated"],
+            }
+            for sh in shards
+        ]
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2, ensure_ascii=False)
+    if cache_info is not None:
+        # Sólo se guardan ejecuciones limpias: un fallo (o un flaky) se repite
+        stored = bool(cache_info["key"]) and returncode == 0 and not timed_out
+        if stored:
+            disk_cache.cache_put(results_cache, cache_info["key"], payload)
+        payload["cached"] = False
+        payload["cache"] = {**cache_info, "stored": stored}
+
+    if args.cache_dir:
+        # Un solo presupuesto LRU para todo --cache-dir: test-files, test-impact y test-results
+        evicted = disk_cache.cache_evict(args.cache_dir, args.cache_max_bytes)
+        if cache_info is not None:
+            payload["cache"]["evicted"] = evicted
+
+    return payload
+
+def main():
+    args = parse_args()
+    write_report(args.out, capture(args))
 
 if __name__ == "__main__":
     main()
@@ -1,43 +1,162 @@
 #!/usr/bin/env python3
 import argparse
-import json
+import bisect
 import os
+import random
 import requests
+import tempfile
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-SONAR_HOST = "https://sonarcloud.io"
+import tracing
+from issue_table import DEFAULT_DROP_FIELDS, delta_ref, project_issue
+from jsonstream import JsonObjectWriter, render_item
+
+SONAR_HOST = os.environ.get("SONAR_HOST_URL", "https://sonarcloud.io").rstrip("/")
+HTTP_TIMEOUT_S = 30
+POOL_SIZE = 16
+
+CE_DONE = {"SUCCESS", "FAILED", "CANCELED"}
+
+_session = None
+
+def sonar_session() -> requests.Session:
+    # Una sola sesión keep-alive para todo el proceso (polls + páginas);
+    # 429/5xx se reintentan con backoff exponencial respetando Retry-After.
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+        _session = requests.Session()
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
 
 def sonar_get(path: str, token: str, params: dict):
     url = f"{SONAR_HOST}{path}"
-    r = requests.get(url, params=params, auth=(token, ""))
-    r.raise_for_status()
-    return r.json()
+    with tracing.span(f"GET {path}", "http", url=url, page=params.get("p")) as span:
+        r = sonar_session().get(url, params=params, auth=(token, ""), timeout=HTTP_TIMEOUT_S)
+        span["status"] = r.status_code
+        r.raise_for_status()
+        return r.json()
 
-def wait_for_pr_analysis(token: str, project_key: str, pr: str, timeout_s: int = 90, sleep_s: int = 3):
-    start = time.time()
+def read_ce_task_id(report_task: str):
+    # El scanner deja `ceTaskId=...` en .scannerwork/report-task.txt
+    try:
+        with open(report_task, "r", encoding="utf-8") as f:
+            for line in f:
+                k, _, v = line.partition("=")
+                if k.strip() == "ceTaskId" and v.strip():
+                    return v.strip()
+    except OSError:
+        pass
+    return None
+
+def backoff_delays(initial_s: float, max_s: float):
+    # Backoff exponencial con jitter (0.5x-1x) para no sincronizar los polls
+    attempt = 0
+    while True:
+        yield min(max_s, initial_s * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        attempt += 1
+
+def poll_until(fetch, done, timeout_s: float, initial_s: float, max_s: float, start: float):
+    # fetch() -> (data, state). Devuelve (data, state, timed_out, attempts).
     deadline = start + timeout_s
-    last = None
-    while time.time() < deadline:
+    delays = backoff_delays(initial_s, max_s)
+    attempts = []
+    while True:
+        t0 = time.time()
+        data, state = fetch()
+        attempts.append({
+            "at_s": round(t0 - start, 2),
+            "latency_ms": int((time.time() - t0) * 1000),
+            "state": state,
+        })
+        if done(state):
+            return data, state, False, attempts
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return data, state, True, attempts
+        time.sleep(min(next(delays), remaining))
+
+def wait_for_pr_analysis(
+    token: str,
+    project_key: str,
+    pr: str,
+    timeout_s: int = 90,
+    initial_s: float = 1.0,
+    max_sleep_s: float = 10.0,
+    ce_task_id: str | None = None,
+):
+    start = time.time()
+
+    def fetch_qg():
         qg = sonar_get(
             "/api/qualitygates/project_status",
             token,
             {"projectKey": project_key, "pullRequest": pr},
         )
-        status = (qg.get("projectStatus") or {}).get("status")
-        last = qg
-        if status and status != "NONE":
-            return qg, {"timed_out": False, "elapsed_s": round(time.time() - start, 2), "timeout_s": timeout_s, "sleep_s": sleep_s}
-        time.sleep(sleep_s)
-    return last, {"timed_out": True, "elapsed_s": round(time.time() - start, 2), "timeout_s": timeout_s, "sleep_s": sleep_s}
+        return qg, (qg.get("projectStatus") or {}).get("status") or "NONE"
+
+    def fetch_task():
+        task = sonar_get("/api/ce/task", token, {"id": ce_task_id}).get("task") or {}
+        return task, task.get("status") or "PENDING"
+
+    meta = {
+        "mode": "ce_task" if ce_task_id else "quality_gate",
+        "timeout_s": timeout_s,
+        "backoff": {"initial_s": initial_s, "max_s": max_sleep_s, "jitter": [0.5, 1.0]},
+    }
+
+    if ce_task_id:
+        # Espera la tarea concreta del análisis y sale en cuanto termina
+        _, task_status, timed_out, attempts = poll_until(
+            fetch_task, lambda st: st in CE_DONE, timeout_s, initial_s, max_sleep_s, start
+        )
+        meta["ce_task"] = {"id": ce_task_id, "status": task_status}
+        qg, _ = fetch_qg()
+    else:
+        qg, _, timed_out, attempts = poll_until(
+            fetch_qg, lambda st: st != "NONE", timeout_s, initial_s, max_sleep_s, start
+        )
+
+    meta.update({
+        "timed_out": timed_out,
+        "elapsed_s": round(time.time() - start, 2),
+        "attempts": attempts,
+    })
+    return qg, meta
 
 def extract_path(component: str) -> str:
     return component.split(":", 1)[1] if ":" in component else component
 
-def load_delta_ranges(delta_path: str) -> dict[str, list[tuple[int,int]]]:
-    with open(delta_path, "r", encoding="utf-8") as f:
-        delta = json.load(f)
+def merge_ranges(lst: list[tuple[int,int]]) -> tuple[list[int], list[int]]:
+    # Intervalos ordenados y fusionados: starts/ends quedan crecientes y se
+    # consultan por bisección.
+    starts, ends = [], []
+    for a, b in sorted(lst):
+        if ends and a <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], b)
+        else:
+            starts.append(a)
+            ends.append(b)
+    return starts, ends
+
+def load_delta_ranges(delta_path: str) -> dict[str, tuple[list[int], list[int]]]:
+    return delta_ranges(tracing.load_json(delta_path))
 
+def delta_ranges(delta: dict) -> dict[str, tuple[list[int], list[int]]]:
     ranges = {}
     for fobj in delta.get("files", []):
         path = fobj.get("path")
@@ -47,107 +166,271 @@ def load_delta_ranges(delta_path: str) -> dict[str, list[tuple[int,int]]]:
             ne = int(h.get("new_end", -1))
             if ne >= ns and ns > 0:
                 lst.append((ns, ne))
-        ranges[path] = lst
+        ranges[path] = merge_ranges(lst)
     return ranges
 
-def intersects(ranges: list[tuple[int,int]], start: int, end: int) -> bool:
-    for a, b in ranges:
-        if not (end < a or start > b):
-            return True
-    return False
+def intersects(ranges: tuple[list[int], list[int]], start: int, end: int) -> bool:
+    starts, ends = ranges
+    # último intervalo que empieza en o antes de `end`
+    i = bisect.bisect_right(starts, end) - 1
+    return i >= 0 and ends[i] >= start
 
-def fetch_all_issues(token: str, project_key: str, pr: str, page_size: int = 500):
-    issues = []
-    page = 1
-    while True:
-        data = sonar_get(
-            "/api/issues/search",
-            token,
-            {"componentKeys": project_key, "pullRequest": pr, "p": page, "ps": page_size},
-        )
-        issues.extend(data.get("issues", []))
-        paging = data.get("paging", {})
-        total = paging.get("total", len(issues))
-        if len(issues) >= total:
-            break
-        page += 1
-    return issues
+def fetch_issues_page(token: str, component_keys: str, pr: str, page: int, page_size: int) -> dict:
+    return sonar_get(
+        "/api/issues/search",
+        token,
+        {"componentKeys": component_keys, "pullRequest": pr, "p": page, "ps": page_size},
+    )
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--project-key", required=True)
-    ap.add_argument("--pr", required=True)
-    ap.add_argument("--out", required=True)
-    ap.add_argument("--delta", required=False, help="Path to delta.json to filter issues")
-    args = ap.parse_args()
+def iter_rest_pages(pool, token: str, keys: str, pr: str, first: dict, page_size: int, window: int):
+    # Páginas 2..N con a lo sumo `window` peticiones en vuelo; se emiten en orden.
+    total = (first.get("paging") or {}).get("total", len(first.get("issues", [])))
+    pending = deque()
+    for p in range(2, -(-total // page_size) + 1):
+        pending.append(pool.submit(fetch_issues_page, token, keys, pr, p, page_size))
+        if len(pending) >= window:
+            yield pending.popleft().result().get("issues", [])
+    while pending:
+        yield pending.popleft().result().get("issues", [])
 
-    token = os.environ.get("SONAR_TOKEN")
-    if not token:
-        raise SystemExit("Missing SONAR_TOKEN env var")
+def iter_issue_pages(token: str, project_key: str, pr: str, page_size: int = 500, concurrency: int = 4):
+    # La página 1 da paging.total; el resto se pide en paralelo.
+    workers = max(1, min(concurrency, POOL_SIZE))
+    first = fetch_issues_page(token, project_key, pr, 1, page_size)
+    yield first.get("issues", [])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from iter_rest_pages(pool, token, project_key, pr, first, page_size, workers)
 
-    qg, wait_meta = wait_for_pr_analysis(token, args.project_key, args.pr, timeout_s=90, sleep_s=3)
-    qg_status = (qg or {}).get("projectStatus", {})
-    status = (qg_status.get("status") or "NONE")
+def fetch_all_issues(token: str, project_key: str, pr: str, page_size: int = 500, concurrency: int = 4):
+    return [iss for page in iter_issue_pages(token, project_key, pr, page_size, concurrency) for iss in page]
 
-    issues = fetch_all_issues(token, args.project_key, args.pr)
+def component_groups(project_key: str, paths: list[str], max_chars: int = 4000):
+    # componentKeys=<proj>:<path>,... en grupos que no pasen de ~max_chars en la URL
+    group, size = [], 0
+    for p in paths:
+        key = f"{project_key}:{p}"
+        if group and size + len(key) + 1 > max_chars:
+            yield ",".join(group)
+            group, size = [], 0
+        group.append(key)
+        size += len(key) + 1
+    if group:
+        yield ",".join(group)
 
-    # Optional retry if QG ready but issues not yet visible
-    if status != "NONE" and len(issues) == 0:
-        time.sleep(3)
-        issues = fetch_all_issues(token, args.project_key, args.pr)
+def iter_touched_issue_pages(token: str, project_key: str, pr: str, paths: list[str], page_size: int = 500, concurrency: int = 4):
+    # Sólo issues de archivos del delta: el resto nunca cruza la red. Los grupos
+    # son disjuntos (no hay duplicados); sus primeras páginas se piden por adelantado.
+    workers = max(1, min(concurrency, POOL_SIZE))
+    groups = iter(component_groups(project_key, sorted(paths)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        firsts = deque()
 
-    filtered = []
-    filter_stats = {"file_not_touched": 0, "no_line_info": 0, "out_of_hunks": 0}
+        def submit_next():
+            keys = next(groups, None)
+            if keys is not None:
+                firsts.append((keys, pool.submit(fetch_issues_page, token, keys, pr, 1, page_size)))
 
-    if args.delta:
-        delta_ranges = load_delta_ranges(args.delta)
-        touched = set(delta_ranges.keys())
+        for _ in range(workers):
+            submit_next()
+        while firsts:
+            keys, fut = firsts.popleft()
+            submit_next()
+            first = fut.result()
+            yield first.get("issues", [])
+            yield from iter_rest_pages(pool, token, keys, pr, first, page_size, workers)
 
-        for iss in issues:
-            path = extract_path(iss.get("component", ""))
-            if path not in touched:
-                filter_stats["file_not_touched"] += 1
-                continue
+def match_issue(iss: dict, delta_ranges: dict, filter_stats: dict):
+    path = extract_path(iss.get("component", ""))
+    if path not in delta_ranges:
+        filter_stats["file_not_touched"] += 1
+        return None
+
+    tr = iss.get("textRange")
+    line = iss.get("line")
+
+    if tr:
+        start = int(tr.get("startLine", 0))
+        end = int(tr.get("endLine", start))
+    elif line:
+        start = end = int(line)
+    else:
+        filter_stats["no_line_info"] += 1
+        return None
+
+    if intersects(delta_ranges[path], start, end):
+        return {"path": path, "start": start, "end": end}
+    filter_stats["out_of_hunks"] += 1
+    return None
 
-            tr = iss.get("textRange")
-            line = iss.get("line")
+def write_sonar(out_path: str, head: dict, pages, delta_ranges, drop_fields: frozenset = DEFAULT_DROP_FIELDS) -> int:
+    # fetch -> filtro -> disco, página a página: la memoria depende del tamaño
+    # de página y no del total de issues. Bytes iguales a json.dump(indent=2).
+    # Cada issue se guarda una vez; los matches del delta son índices a `issues`.
+    filter_stats = {"file_not_touched": 0, "no_line_info": 0, "out_of_hunks": 0}
+    filtered_count = 0
+    with tracing.span("json.dump", "json", path=out_path), open(out_path, "w", encoding="utf-8") as f, tempfile.TemporaryFile(
+        "w+", encoding="utf-8", dir=os.path.dirname(out_path) or None
+    ) as spool:
+        w = JsonObjectWriter(f)
+        for k, v in head.items():
+            w.value(k, v)
+        w.begin_list("issues")
+        for page in pages:
+            for iss in page:
+                index = w.items
+                w.item(project_issue(iss, drop_fields))
+                if delta_ranges is None:
+                    continue
+                m = match_issue(iss, delta_ranges, filter_stats)
+                if m is not None:
+                    spool.write(render_item(delta_ref(index, m), filtered_count == 0))
+                    filtered_count += 1
+        issues_count = w.end_list()
+        w.value("issues_count", issues_count)
+        w.spooled_list("issues_filtered_by_delta", spool, filtered_count)
+        w.value("issues_filtered_count", filtered_count)
+        w.value("filter_stats", filter_stats if delta_ranges is not None else None)
+        w.close()
+    return issues_count
 
-            if tr:
-                start = int(tr.get("startLine", 0))
-                end = int(tr.get("endLine", start))
-            elif line:
-                start = end = int(line)
-            else:
-                filter_stats["no_line_info"] += 1
+def collect_sonar(head: dict, pages, ranges, drop_fields: frozenset = DEFAULT_DROP_FIELDS) -> dict:
+    # Igual que write_sonar() pero en memoria (orquestador): mismo contenido
+    filter_stats = {"file_not_touched": 0, "no_line_info": 0, "out_of_hunks": 0}
+    issues, filtered = [], []
+    for page in pages:
+        for iss in page:
+            index = len(issues)
+            issues.append(project_issue(iss, drop_fields))
+            if ranges is None:
                 continue
+            m = match_issue(iss, ranges, filter_stats)
+            if m is not None:
+                filtered.append(delta_ref(index, m))
+    return {
+        **head,
+        "issues": issues,
+        "issues_count": len(issues),
+        "issues_filtered_by_delta": filtered,
+        "issues_filtered_count": len(filtered),
+        "filter_stats": filter_stats if ranges is not None else None,
+    }
+
+def stub_sonar() -> dict:
+    # sonar.json cuando no hay análisis (PR de fork / sin token)
+    return {
+        "meta": {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "tool": "qualityrisk.sonar_fetch",
+            "version": "stub"
+        },
+        "projectKey": "unknown",
+        "pullRequest": "unknown",
+        "qualityGate": {"status": "NONE"},
+        "issues": [],
+        "issues_count": 0,
+        "issues_filtered_by_delta": [],
+        "issues_filtered_count": 0,
+        "filter_stats": None
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sonar-host", default=SONAR_HOST, help="Sonar base URL (env SONAR_HOST_URL)")
+    ap.add_argument("--project-key", required=True)
+    ap.add_argument("--pr", required=True)
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--delta", required=False, help="Path to delta.json to filter issues")
+    ap.add_argument("--page-concurrency", type=int, default=4, help="Parallel requests for issue pages 2..N")
+    ap.add_argument(
+        "--scope",
+        choices=["project", "touched"],
+        default="project",
+        help="touched: query only files listed in --delta (server-side scoping)",
+    )
+    ap.add_argument("--issue-field", action="append", default=[], help="Keep a field dropped by default (flows, impacts, comments, ...)")
+    ap.add_argument("--full-issues", action="store_true", help="Store issues exactly as returned by Sonar")
+    ap.add_argument("--report-task", default=".scannerwork/report-task.txt", help="Scanner metadata with ceTaskId")
+    ap.add_argument("--wait-timeout", type=int, default=90)
+    ap.add_argument("--poll-initial", type=float, default=1.0)
+    ap.add_argument("--poll-max", type=float, default=10.0)
+    return ap
+
+def wait_analysis(args, token: str):
+    # Espera del análisis (no necesita delta: se puede lanzar en paralelo)
+    global SONAR_HOST
+    SONAR_HOST = args.sonar_host.rstrip("/")
+
+    ce_task_id = read_ce_task_id(args.report_task)
+    qg, wait_meta = wait_for_pr_analysis(
+        token,
+        args.project_key,
+        args.pr,
+        timeout_s=args.wait_timeout,
+        initial_s=args.poll_initial,
+        max_sleep_s=args.poll_max,
+        ce_task_id=ce_task_id,
+    )
+    return qg, wait_meta, ce_task_id
+
+def prepare(args, token: str, ranges, waited=None):
+    # Cabecera de sonar.json + fuente de páginas de issues (waited: resultado de wait_analysis)
+    qg, wait_meta, ce_task_id = waited or wait_analysis(args, token)
+    qg_status = (qg or {}).get("projectStatus", {})
+    status = (qg_status.get("status") or "NONE")
+
+    scope = args.scope if ranges is not None else "project"
 
-            if intersects(delta_ranges.get(path, []), start, end):
-                iss2 = dict(iss)
-                iss2["_delta_match"] = {"path": path, "start": start, "end": end}
-                filtered.append(iss2)
-            else:
-                filter_stats["out_of_hunks"] += 1
+    def pages():
+        if scope == "touched":
+            return iter_touched_issue_pages(token, args.project_key, args.pr, list(ranges), concurrency=args.page_concurrency)
+        return iter_issue_pages(token, args.project_key, args.pr, concurrency=args.page_concurrency)
 
-    payload = {
+    head = {
         "meta": {
             "generated_at": datetime.now(timezone.utc).isoformat(),
             "tool": "qualityrisk.sonar_fetch",
-            "version": "1.2.1",
+            "version": "2.0.0",
+            "issues_filtered_format": "refs",
         },
         "projectKey": args.project_key,
         "pullRequest": args.pr,
+        "issues_scope": scope,
         "wait_for_analysis": wait_meta,
         "qualityGate": qg_status,
-        "issues": issues,
-        "issues_count": len(issues),
-        "issues_filtered_by_delta": filtered,
-        "issues_filtered_count": len(filtered),
-        "filter_stats": filter_stats if args.delta else None,
     }
 
+    drop_fields = frozenset() if args.full_issues else DEFAULT_DROP_FIELDS - set(args.issue_field)
+
+    # Optional retry if QG ready but issues not yet visible
+    # (con la tarea CE en SUCCESS los issues ya están indexados)
+    retry_empty = status != "NONE" and not ce_task_id
+    return head, pages, drop_fields, retry_empty
+
+def fetch_sonar(args, token: str, delta: dict | None = None, waited=None) -> dict:
+    ranges = delta_ranges(delta) if delta is not None else None
+    head, pages, drop_fields, retry_empty = prepare(args, token, ranges, waited)
+    sonar = collect_sonar(head, pages(), ranges, drop_fields)
+    if retry_empty and sonar["issues_count"] == 0:
+        time.sleep(3)
+        sonar = collect_sonar(head, pages(), ranges, drop_fields)
+    return sonar
+
+def main():
+    args = build_parser().parse_args()
+
+    token = os.environ.get("SONAR_TOKEN")
+    if not token:
+        raise SystemExit("Missing SONAR_TOKEN env var")
+
+    ranges = load_delta_ranges(args.delta) if args.delta else None
+    head, pages, drop_fields, retry_empty = prepare(args, token, ranges)
+
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2, ensure_ascii=False)
+    issues_count = write_sonar(args.out, head, pages(), ranges, drop_fields)
+
+    if retry_empty and issues_count == 0:
+        time.sleep(3)
+        write_sonar(args.out, head, pages(), ranges, drop_fields)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
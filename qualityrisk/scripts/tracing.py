@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Spans de tiempo compartidos por todos los scripts: subprocesos, HTTP,
+# JSON load/dump y evaluación de reglas. Se acumulan en memoria del proceso;
+# con QUALITYRISK_TRACE_DIR cada script deja sus spans en ese directorio al
+# salir, así build_evidence_pack (meta.timings) y el export Chrome ven el job
+# entero aunque cada etapa sea un proceso distinto.
+#
+#   python qualityrisk/scripts/tracing.py --dir "$QUALITYRISK_TRACE_DIR" --out qualityrisk/out/trace.json
+#
+# El fichero de salida se abre en chrome://tracing o https://ui.perfetto.dev
+import argparse
+import atexit
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_DIR_ENV = "QUALITYRISK_TRACE_DIR"
+SLOWEST_N = 10
+MAX_ARG_CHARS = 200
+
+_spans: list[dict] = []
+_lock = threading.Lock()
+
+
+def process_name() -> str:
+    return os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+
+@contextmanager
+def span(name: str, cat: str, **args):
+    # `args` se devuelve para que el llamador añada datos al cerrar (status, exit_code...)
+    ts = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield args
+    finally:
+        rec = {
+            "name": name,
+            "cat": cat,
+            "ts_us": int(ts * 1_000_000),
+            "dur_us": int((time.perf_counter() - t0) * 1_000_000),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": args,
+        }
+        with _lock:
+            _spans.append(rec)
+
+
+def cmd_span(cmd: list[str], **args):
+    # Nombre corto: programa + primer argumento que no es opción ("git diff",
+    # "npm test"); la línea completa, recortada, va en args
+    prog = os.path.basename(str(cmd[0])) if cmd else "?"
+    sub = next((str(c) for c in cmd[1:] if not str(c).startswith("-")), "")
+    name = f"{prog} {sub[:40]}".strip()
+    return span(name, "subprocess", cmd=" ".join(map(str, cmd))[:MAX_ARG_CHARS], **args)
+
+
+def load_json(path: str):
+    with span("json.load", "json", path=path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def dump_json(obj, path: str, **kwargs):
+    with span("json.dump", "json", path=path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, **kwargs)
+
+
+def local_spans() -> list[dict]:
+    with _lock:
+        return list(_spans)
+
+
+def load_dir(trace_dir: str) -> list[dict]:
+    spans = []
+    for p in sorted(glob.glob(os.path.join(trace_dir, "*.json"))):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for rec in data.get("spans") or []:
+            rec.setdefault("process", data.get("process"))
+            spans.append(rec)
+    return spans
+
+
+def all_spans() -> list[dict]:
+    # Los de este proceso + los que otros scripts dejaron en QUALITYRISK_TRACE_DIR
+    own = [{**rec, "process": process_name()} for rec in local_spans()]
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    if not trace_dir:
+        return own
+    pid = os.getpid()
+    return [rec for rec in load_dir(trace_dir) if rec.get("pid") != pid] + own
+
+
+def timings(spans: list[dict] | None = None) -> dict:
+    spans = all_spans() if spans is None else spans
+    if not spans:
+        return {"spans": 0, "wall_ms": 0, "by_category": {}, "slowest": []}
+
+    start = min(s["ts_us"] for s in spans)
+    end = max(s["ts_us"] + s["dur_us"] for s in spans)
+
+    by_cat: dict[str, dict] = {}
+    for s in spans:
+        c = by_cat.setdefault(s["cat"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = s["dur_us"] / 1000
+        c["count"] += 1
+        c["total_ms"] += ms
+        c["max_ms"] = max(c["max_ms"], ms)
+    for c in by_cat.values():
+        c["total_ms"] = round(c["total_ms"], 1)
+        c["max_ms"] = round(c["max_ms"], 1)
+
+    slowest = sorted(spans, key=lambda s: s["dur_us"], reverse=True)[:SLOWEST_N]
+    return {
+        "spans": len(spans),
+        "wall_ms": round((end - start) / 1000, 1),
+        "by_category": dict(sorted(by_cat.items())),
+        "slowest": [
+            {
+                "name": s["name"],
+                "cat": s["cat"],
+                "process": s.get("process"),
+                "start_ms": round((s["ts_us"] - start) / 1000, 1),
+                "ms": round(s["dur_us"] / 1000, 1),
+            }
+            for s in slowest
+        ],
+    }
+
+
+def chrome_trace(spans: list[dict] | None = None) -> dict:
+    # Formato trace-event: un evento "X" (completo) por span + nombre de proceso
+    spans = all_spans() if spans is None else spans
+    events = []
+    names = {}
+    for s in spans:
+        names.setdefault(s["pid"], s.get("process") or str(s["pid"]))
+        events.append({
+            "name": s["name"],
+            "cat": s["cat"],
+            "ph": "X",
+            "ts": s["ts_us"],
+            "dur": s["dur_us"],
+            "pid": s["pid"],
+            "tid": s["tid"],
+            "args": s.get("args") or {},
+        })
+    for pid, name in names.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome(path: str, spans: list[dict] | None = None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(spans), f)
+
+
+@atexit.register
+def flush():
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    spans = local_spans()
+    if not trace_dir or not spans:
+        return
+    os.makedirs(trace_dir, exist_ok=True)
+    path = os.path.join(trace_dir, f"{process_name()}-{os.getpid()}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"process": process_name(), "pid": os.getpid(), "spans": spans}, f)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default=os.environ.get(TRACE_DIR_ENV), help=f"Span directory (env {TRACE_DIR_ENV})")
+    ap.add_argument("--out", required=True, help="Chrome trace-event JSON")
+    ap.add_argument("--summary", action="store_true", help="Print the timings summary")
+    args = ap.parse_args()
+    if not args.dir:
+        raise SystemExit(f"Missing --dir (or {TRACE_DIR_ENV})")
+
+    spans = load_dir(args.dir)
+    write_chrome(args.out, spans)
+    print(f"Wrote {len(spans)} spans to {args.out}")
+    if args.summary:
+        print(json.dumps(timings(spans), indent=2))
+
+
+if __name__ == "__main__":
+    main()